@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+#------------------------------------------------------------------------------
+# file: $Id$
+# lib:  pyramid_controllers.benchmark
+# date: 2026/10/17
+# copy: (C) Copyright 2026 Cadit Inc., see LICENSE.txt
+#------------------------------------------------------------------------------
+
+'''
+``pyramid_controllers.benchmark`` is a micro-benchmark of the request
+dispatch mechanism. It generates a synthetic controller tree and times
+:meth:`pyramid_controllers.Dispatcher.dispatch` directly against stub
+requests (i.e. without any WebOb, WebTest or pyramid routing overhead)
+for a set of request scenarios. The results are emitted as JSON and can
+be compared against a previously saved baseline, for example::
+
+  $ python -m pyramid_controllers.benchmark --output baseline.json
+  ... upgrade ...
+  $ python -m pyramid_controllers.benchmark --baseline baseline.json
+
+which exits with a non-zero status if any scenario is slower than the
+baseline by more than the `--threshold` fraction.
+'''
+
+import sys
+import json
+import platform
+import argparse
+import timeit
+
+from pyramid.httpexceptions import HTTPException
+
+from .controller import Controller
+from .restcontroller import RestController
+from .decorator import expose, lookup, wrap
+from .dispatcher import Dispatcher
+from .util import adict, getVersion
+
+#------------------------------------------------------------------------------
+class StubRequest(object):
+  '''
+  A minimal stand-in for a :class:`pyramid.request.Request` that
+  provides only the attributes that the Dispatcher requires for
+  string-returning handlers.
+  '''
+  def __init__(self, method, path):
+    self.method       = method
+    self.path         = path
+    self.query_string = ''
+    self.params       = {}
+    self.matchdict    = {'pyramid_controllers_path': path}
+    self.response     = adict()
+
+#------------------------------------------------------------------------------
+def _makeHandler(result, names=None, exts=None):
+  def handler(self, request):
+    return result
+  if names or exts:
+    return expose(name=names, ext=exts)(handler)
+  return expose(handler)
+
+#------------------------------------------------------------------------------
+def _makeWrapper():
+  def wrapper(self, request, handler):
+    return handler(request)
+  return wrap(wrapper)
+
+#------------------------------------------------------------------------------
+def _makeLookup(child):
+  def _lookup(self, request, key, *rem):
+    return (child, rem)
+  return lookup(_lookup)
+
+#------------------------------------------------------------------------------
+class RestLeaf(RestController):
+  @expose
+  def get(self, request): return 'rest.get'
+  @expose
+  def put(self, request): return 'rest.put'
+  @expose
+  def post(self, request): return 'rest.post'
+  @expose
+  def delete(self, request): return 'rest.delete'
+
+#------------------------------------------------------------------------------
+def makeTree(depth=3, width=5, aliases=0, exts=0, lookups=False,
+             wrappers=0, rest=False):
+  '''
+  Generates a synthetic controller tree and returns its root
+  controller. Each of the `depth` levels is a distinct Controller
+  subclass that has `width` exposed handlers (``m0``, ``m1``, etc),
+  each exposed under `aliases` additional names (``m0-a0``, etc) and
+  `exts` extensions (``m0.e0``, etc), `wrappers` @wrap handlers, and
+  (except for the deepest level) `width` attributes (``c0``, etc) that
+  reference the next level's controller. If `lookups` is truthy,
+  each non-leaf level also has a @lookup that consumes one path
+  component and continues with the next level. If `rest` is truthy,
+  the deepest level has a RestController attribute named ``rest``.
+  '''
+  child = None
+  for level in reversed(range(depth)):
+    attrs = dict()
+    for idx in range(width):
+      name  = 'm%d' % idx
+      names = None
+      if aliases or exts:
+        names = [name] + ['%s-a%d' % (name, alias) for alias in range(aliases)]
+      attrs[name] = _makeHandler(
+        'L%d.%s' % (level, name), names,
+        [None] + ['e%d' % ext for ext in range(exts)] if exts else None)
+    for idx in range(wrappers):
+      attrs['_wrap%d' % idx] = _makeWrapper()
+    if child is not None:
+      for idx in range(width):
+        attrs['c%d' % idx] = child
+      if lookups:
+        attrs['_lookup'] = _makeLookup(child)
+    elif rest:
+      attrs['rest'] = RestLeaf()
+    child = type('Level%d' % level, (Controller,), attrs)()
+  return child
+
+#------------------------------------------------------------------------------
+def makeScenarios(depth=3, width=5, aliases=0, exts=0, lookups=False,
+                  wrappers=0, rest=False):
+  '''
+  Returns a dict of the request scenarios that exercise a tree that
+  was generated by :func:`makeTree` with the same parameters. Each
+  scenario is a tuple of ``(method, path, expected_body)``, where an
+  `expected_body` of ``None`` indicates a 404.
+  '''
+  prefix = ''.join('/c%d' % ((width - 1) * (lvl % 2)) for lvl in range(depth - 1))
+  leaf   = 'L%d.m%d' % (depth - 1, width - 1)
+  ret = adict(
+    static   = ('GET', '%s/m%d' % (prefix, width - 1), leaf),
+    shallow  = ('GET', '/m0', 'L0.m0'),
+    notfound = ('GET', '%s/no-such-handler' % (prefix,), None),
+  )
+  if aliases:
+    ret.alias = ('GET', '%s/m%d-a%d' % (prefix, width - 1, aliases - 1), leaf)
+  if exts:
+    ret.ext = ('GET', '%s/m%d.e%d' % (prefix, width - 1, exts - 1), leaf)
+  if lookups and depth > 1:
+    ret.lookup = ('GET', '/key' * (depth - 1) + '/m%d' % (width - 1), leaf)
+  if rest:
+    ret['rest-get'] = ('GET', prefix + '/rest', 'rest.get')
+    ret['rest-put'] = ('PUT', prefix + '/rest', 'rest.put')
+  return ret
+
+#------------------------------------------------------------------------------
+def _dispatch(dispatcher, root, request):
+  try:
+    return dispatcher.dispatch(request, root)
+  except (HTTPException,), exc:
+    return exc
+
+#------------------------------------------------------------------------------
+def run(tree=None, number=2000, repeat=3, dispatcher=None):
+  '''
+  Runs the benchmark and returns the results as a JSON-serializable
+  dict. `tree` is a dict of :func:`makeTree` parameters, `number` is
+  the number of dispatches per timing run, `repeat` the number of
+  timing runs per scenario (the best run is reported), and
+  `dispatcher` is a dict of :class:`Dispatcher` constructor
+  parameters.
+  '''
+  tree       = dict(tree or {})
+  options    = dict(dispatcher or {})
+  root       = makeTree(**tree)
+  dispatcher = Dispatcher(**options)
+  results    = dict()
+  for name, (method, path, expected) in sorted(makeScenarios(**tree).items()):
+    response = _dispatch(dispatcher, root, StubRequest(method, path))
+    if expected is None:
+      if getattr(response, 'code', None) != 404:
+        raise ValueError('scenario %r: expected a 404, got %r' % (name, response))
+    elif getattr(response, 'body', None) != expected:
+      raise ValueError('scenario %r: expected %r, got %r' % (name, expected, response))
+    times = []
+    for count in range(repeat):
+      requests = [StubRequest(method, path) for idx in range(number)]
+      start = timeit.default_timer()
+      for request in requests:
+        _dispatch(dispatcher, root, request)
+      times.append(timeit.default_timer() - start)
+    results[name] = dict(
+      method = method,
+      path   = path,
+      number = number,
+      best   = min(times) / number,
+      mean   = sum(times) / ( number * len(times) ),
+    )
+  return dict(
+    version    = getVersion(),
+    python     = platform.python_version(),
+    tree       = tree,
+    dispatcher = options,
+    results    = results,
+  )
+
+#------------------------------------------------------------------------------
+def compare(current, baseline, threshold=0.1):
+  '''
+  Compares the `current` results to the `baseline` results (both as
+  returned by :func:`run`) and returns a list of adicts, one per
+  scenario present in both, with the attributes `name`, `current`,
+  `baseline` (best time per dispatch, in seconds), `ratio` and
+  `regression`, which is truthy if `current` is slower than `baseline`
+  by more than the `threshold` fraction.
+  '''
+  ret = []
+  for name, result in sorted(current['results'].items()):
+    base = baseline.get('results', {}).get(name)
+    if not base:
+      continue
+    ratio = result['best'] / base['best']
+    ret.append(adict(
+      name=name, current=result['best'], baseline=base['best'],
+      ratio=ratio, regression=ratio > 1 + threshold))
+  return ret
+
+#------------------------------------------------------------------------------
+def main(argv=None):
+  cli = argparse.ArgumentParser(
+    description='Micro-benchmark of the pyramid-controllers dispatcher.')
+  cli.add_argument('--depth', type=int, default=3, help='tree depth (default: %(default)s)')
+  cli.add_argument('--width', type=int, default=5, help='handlers and sub-controllers per level (default: %(default)s)')
+  cli.add_argument('--aliases', type=int, default=0, help='additional @expose names per handler')
+  cli.add_argument('--exts', type=int, default=0, help='@expose extensions per handler')
+  cli.add_argument('--lookups', action='store_true', help='add a @lookup to each level')
+  cli.add_argument('--wrappers', type=int, default=0, help='@wrap handlers per level')
+  cli.add_argument('--rest', action='store_true', help='add a RestController to the deepest level')
+  cli.add_argument('--plan-cache', type=int, default=0, metavar='SIZE', help='dispatcher `planCacheSize`')
+  cli.add_argument('--number', type=int, default=2000, help='dispatches per timing run (default: %(default)s)')
+  cli.add_argument('--repeat', type=int, default=3, help='timing runs per scenario (default: %(default)s)')
+  cli.add_argument('--output', metavar='FILENAME', help='save the JSON results to FILENAME')
+  cli.add_argument('--baseline', metavar='FILENAME', help='compare the results to the JSON results in FILENAME')
+  cli.add_argument('--threshold', type=float, default=0.1, help='the slowdown fraction that is considered a regression (default: %(default)s)')
+  options = cli.parse_args(argv)
+
+  tree = dict(
+    depth=options.depth, width=options.width, aliases=options.aliases,
+    exts=options.exts, lookups=options.lookups, wrappers=options.wrappers,
+    rest=options.rest)
+  results = run(
+    tree=tree, number=options.number, repeat=options.repeat,
+    dispatcher=dict(planCacheSize=options.plan_cache))
+  output = json.dumps(results, indent=2, sort_keys=True)
+  if options.output:
+    with open(options.output, 'wb') as fp:
+      fp.write(output + '\n')
+  else:
+    sys.stdout.write(output + '\n')
+
+  if not options.baseline:
+    return 0
+  with open(options.baseline, 'rb') as fp:
+    baseline = json.load(fp)
+  failed = False
+  for item in compare(results, baseline, threshold=options.threshold):
+    failed = failed or item.regression
+    sys.stderr.write('%-12s %10.2f us %10.2f us %7.2fx%s\n' % (
+      item.name, item.baseline * 1e6, item.current * 1e6, item.ratio,
+      '  REGRESSION' if item.regression else ''))
+  return 1 if failed else 0
+
+#------------------------------------------------------------------------------
+if __name__ == '__main__':
+  sys.exit(main())
+
+#------------------------------------------------------------------------------
+# end of $Id$
+#------------------------------------------------------------------------------
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+#------------------------------------------------------------------------------
+# file: $Id$
+# lib:  pyramid_controllers.cache
+# date: 2026/10/17
+# copy: (C) Copyright 2026 Cadit Inc., see LICENSE.txt
+#------------------------------------------------------------------------------
+
+'''
+``pyramid_controllers.cache`` provides the bounded caches used
+internally by the dispatcher and the response cache backends.
+'''
+
+import time
+import threading
+import collections
+
+from .util import adict
+
+#------------------------------------------------------------------------------
+class LRUCache(object):
+  '''
+  A thread-safe mapping that holds at most `maxsize` entries and, when
+  full, evicts the least-recently-used entry. If `ttl` is specified,
+  entries also expire `ttl` seconds after they were stored. It keeps
+  track of the number of cache hits, misses and evictions, which are
+  available via :meth:`stats`.
+  '''
+
+  #----------------------------------------------------------------------------
+  def __init__(self, maxsize=1024, ttl=None):
+    self.maxsize   = maxsize
+    self.ttl       = ttl
+    self.lock      = threading.Lock()
+    self.data      = collections.OrderedDict()
+    self.hits      = 0
+    self.misses    = 0
+    self.evictions = 0
+
+  #----------------------------------------------------------------------------
+  def __len__(self):
+    return len(self.data)
+
+  #----------------------------------------------------------------------------
+  def __contains__(self, key):
+    if self.ttl is None:
+      return key in self.data
+    entry = self.data.get(key)
+    return entry is not None and entry[0] > time.time()
+
+  #----------------------------------------------------------------------------
+  def get(self, key, default=None):
+    with self.lock:
+      try:
+        value = self.data.pop(key)
+      except KeyError:
+        self.misses += 1
+        return default
+      if self.ttl is not None:
+        if value[0] <= time.time():
+          self.misses += 1
+          return default
+        self.data[key] = value
+        self.hits += 1
+        return value[1]
+      self.data[key] = value
+      self.hits += 1
+      return value
+
+  #----------------------------------------------------------------------------
+  def put(self, key, value):
+    with self.lock:
+      self.data.pop(key, None)
+      if self.ttl is None:
+        self.data[key] = value
+      else:
+        self.data[key] = ( time.time() + self.ttl, value )
+      while len(self.data) > self.maxsize:
+        self.data.popitem(last=False)
+        self.evictions += 1
+    return value
+
+  #----------------------------------------------------------------------------
+  def invalidate(self, key):
+    '''
+    Removes the entry for `key` (if present) from the cache.
+    '''
+    with self.lock:
+      self.data.pop(key, None)
+
+  #----------------------------------------------------------------------------
+  def clear(self):
+    '''
+    Removes all entries from the cache (but does not reset the
+    statistics counters).
+    '''
+    with self.lock:
+      self.data.clear()
+
+  #----------------------------------------------------------------------------
+  def stats(self):
+    '''
+    Returns an adict with the current `size`, `maxsize`, and the
+    `hits`, `misses` and `evictions` counters of this cache.
+    '''
+    return adict(
+      size=len(self.data), maxsize=self.maxsize,
+      hits=self.hits, misses=self.misses, evictions=self.evictions)
+
+#------------------------------------------------------------------------------
+class LookupCache(object):
+  '''
+  Memoizes the results of a @lookup handler (see the @lookup `cache`
+  parameter). A result, i.e. the returned controller and the values
+  of the request attributes named in `attrs` that the lookup set, is
+  keyed by the class of the controller that the lookup is bound to
+  and the path components that the lookup consumed, and is held for
+  at most `ttl` seconds (if specified) in a least-recently-used cache
+  of at most `size` entries. The number of components consumed is the number of
+  named positional parameters of the lookup handler (after
+  `request`), and results are only stored if the lookup returned
+  exactly the remaining components. Since results are keyed by
+  controller class, controller subclasses that inherit a cached
+  @lookup never share results, whereas instances of the same class
+  (e.g. controllers that are instantiated per request) do. The
+  lookup's result must therefore not depend on anything other than
+  its controller's class and the consumed path components.
+  '''
+
+  #----------------------------------------------------------------------------
+  def __init__(self, size=1024, ttl=None, attrs=()):
+    self.attrs = tuple(attrs)
+    self.cache = LRUCache(size, ttl=ttl)
+
+  #----------------------------------------------------------------------------
+  def __call__(self, controller, lookup, arity, request, *remainder):
+    '''
+    Returns the result of calling ``lookup(request, *remainder)``,
+    where `lookup` is the @lookup handler of `controller` and
+    consumes `arity` path components, from the cache if available.
+    '''
+    if len(remainder) < arity:
+      return lookup(request, *remainder)
+    key   = ( type(controller), tuple(remainder[:arity]) )
+    entry = self.cache.get(key)
+    if entry is not None:
+      for name, value in entry[1]:
+        setattr(request, name, value)
+      return ( entry[0], remainder[arity:] )
+    ret = lookup(request, *remainder)
+    if tuple(ret[1]) == tuple(remainder[arity:]):
+      self.cache.put(key, ( ret[0], tuple(
+        ( name, getattr(request, name) )
+        for name in self.attrs if hasattr(request, name)) ))
+    return ret
+
+  #----------------------------------------------------------------------------
+  def invalidate(self, *segments):
+    '''
+    Removes the results for the consumed path components `segments`,
+    e.g. ``cache.invalidate(resource_id)``, of all controllers from
+    the cache.
+    '''
+    segments = tuple(segments)
+    with self.cache.lock:
+      for key in [key for key in self.cache.data.keys() if key[1] == segments]:
+        del self.cache.data[key]
+
+  #----------------------------------------------------------------------------
+  def clear(self):
+    '''
+    Removes all results from the cache.
+    '''
+    self.cache.clear()
+
+  #----------------------------------------------------------------------------
+  def stats(self):
+    '''
+    Returns the statistics of the underlying cache (see
+    :meth:`LRUCache.stats`).
+    '''
+    return self.cache.stats()
+
+#------------------------------------------------------------------------------
+class ResponseCache(object):
+  '''
+  The interface of response cache backends (see the Dispatcher's
+  `responseCache` parameter and the @expose `cache` parameter). Keys
+  are strings and values are opaque, picklable objects; backends are
+  free to drop entries at any time.
+  '''
+
+  #----------------------------------------------------------------------------
+  def get(self, key):
+    '''
+    Returns the value stored for `key`, or ``None`` if there is none
+    or it has expired.
+    '''
+    raise NotImplementedError()
+
+  #----------------------------------------------------------------------------
+  def put(self, key, value, ttl=None):
+    '''
+    Stores `value` for `key` for at most `ttl` seconds (if specified).
+    '''
+    raise NotImplementedError()
+
+  #----------------------------------------------------------------------------
+  def clear(self):
+    '''
+    Removes all entries from the cache.
+    '''
+    raise NotImplementedError()
+
+  #----------------------------------------------------------------------------
+  def stats(self):
+    '''
+    Returns an adict of backend-specific metrics, which should include
+    at least the `hits` and `misses` counters.
+    '''
+    raise NotImplementedError()
+
+#------------------------------------------------------------------------------
+class MemoryResponseCache(ResponseCache):
+  '''
+  The default, in-process :class:`ResponseCache` backend: a
+  least-recently-used cache of at most `size` entries with per-entry
+  expiry. Its :meth:`stats` are those of :meth:`LRUCache.stats`, plus
+  the number of `expirations` (which are counted as misses).
+  '''
+
+  #----------------------------------------------------------------------------
+  def __init__(self, size=1024):
+    self.cache       = LRUCache(size)
+    self.expirations = 0
+
+  #----------------------------------------------------------------------------
+  def get(self, key):
+    entry = self.cache.get(key)
+    if entry is None:
+      return None
+    if entry[0] is not None and entry[0] <= time.time():
+      self.cache.invalidate(key)
+      self.expirations += 1
+      return None
+    return entry[1]
+
+  #----------------------------------------------------------------------------
+  def put(self, key, value, ttl=None):
+    self.cache.put(key, ( time.time() + ttl if ttl else None, value ))
+
+  #----------------------------------------------------------------------------
+  def clear(self):
+    self.cache.clear()
+
+  #----------------------------------------------------------------------------
+  def stats(self):
+    ret = self.cache.stats()
+    ret.hits        -= self.expirations
+    ret.misses      += self.expirations
+    ret.expirations  = self.expirations
+    return ret
+
+#------------------------------------------------------------------------------
+# end of $Id$
+#------------------------------------------------------------------------------
@@ -10,6 +10,7 @@
 
 import types, inspect, new
 from .util import adict, isstr
+from .cache import LookupCache
 
 PCATTR = '__pyramid_controllers__'
 # todo: fix this so that both attributes can use the same name
@@ -70,9 +71,27 @@ class ExposeDecorator(Decorator):
 class FiddleDecorator(Decorator):  attribute = 'fiddle'
 class WrapDecorator(Decorator):    attribute = 'wrap'
 class IndexDecorator(Decorator):   attribute = 'index'
-class LookupDecorator(Decorator):  attribute = 'lookup'
 class DefaultDecorator(Decorator): attribute = 'default'
 
+#------------------------------------------------------------------------------
+class LookupDecorator(Decorator):
+  attribute = 'lookup'
+  def enhance(self, wrapped, decoration, kw):
+    if kw.cache:
+      # the number of path components consumed, i.e. the number of
+      # positional parameters after `self` and `request`
+      try:
+        kw.arity = max(0, len(inspect.getargspec(wrapped).args) - 2)
+      except TypeError:
+        # the arity of non-function callables is unknown: no caching
+        kw.cache = None
+    if kw.cache:
+      if kw.cache is True:
+        kw.cache = LookupCache()
+      elif not isinstance(kw.cache, LookupCache):
+        kw.cache = LookupCache(**kw.cache)
+    super(LookupDecorator, self).enhance(wrapped, decoration, kw)
+
 #------------------------------------------------------------------------------
 def makeDecorator(klass, doc=None):
   def decorator(*args, **kw):
@@ -94,7 +113,11 @@ expose = makeDecorator(ExposeDecorator, doc='''\
 
   renderer : str, optional
 
-    Specifies the renderer to use.
+    Specifies the renderer to use. Handlers that return an iterator
+    (e.g. are generators) can use the ``ndjson`` and ``jsonstream``
+    renderers to stream the items lazily (see
+    :mod:`pyramid_controllers.stream`); if no renderer is specified,
+    the iterator's items are streamed as-is.
 
   name : { str, list(str) }, optional
 
@@ -133,6 +156,61 @@ expose = makeDecorator(ExposeDecorator, doc='''\
     modify bindings provided by the RestController, so this parameter
     should typically not be used on subclasses of RestController.
 
+  cache : { bool, int, dict }, optional
+
+    Enables server-side caching of the rendered response of ``GET``
+    and ``HEAD`` requests in the dispatcher's `responseCache`. If a
+    dict, it specifies the `ttl` (in seconds, default: until evicted)
+    and `vary`, the list of request header names whose values, in
+    addition to the method and the URL (including the query string),
+    identify a response; an int is shorthand for the `ttl`. The cache
+    is consulted after all @fiddle and @wrap handlers have been
+    invoked (so that, e.g., access control wrappers are always
+    applied); on a hit, the cached response is returned to the
+    wrappers without invoking the handler and the renderer. Note that
+    the wrappers of a caching handler therefore always receive the
+    rendered Response. Only ``200 OK`` responses that do not set
+    cookies and that are not marked ``Cache-Control: private`` or
+    ``no-store`` are stored. For example, ``cache=dict(ttl=30,
+    vary=['Accept'])``.
+
+  etag : { callable, str }, optional
+
+    Specifies a cheap validator that returns the entity tag of the
+    response for a request, which enables conditional ``GET`` and
+    ``HEAD`` requests: if the request's ``If-None-Match`` header
+    matches, a "304 Not Modified" response is returned (to the @wrap
+    handlers, which are always invoked) without invoking the handler
+    and the renderer. Otherwise, the
+    entity tag is set on the response. The validator is either a
+    callable that is called with the `request`, or the name of a
+    method of the controller that is called with the `request`. If
+    it returns ``None``, the request is handled unconditionally.
+
+  lastModified : { callable, str }, optional
+
+    Similar to `etag`, but the validator returns the last
+    modification time of the response (a datetime or a UNIX
+    timestamp), which is compared to the request's
+    ``If-Modified-Since`` header (which is ignored if the request has
+    an ``If-None-Match`` header).
+
+  head : bool, default: false
+
+    Only applicable if the dispatcher's `fastHead` mode is enabled, in
+    which case the results of ``HEAD`` requests are by default not
+    rendered: setting this to truthy makes the dispatcher render the
+    result (and then discard the body), e.g. if the headers that the
+    renderer sets are needed.
+
+  contentLength : { callable, str }, optional
+
+    Only applicable if the dispatcher's `fastHead` mode is enabled:
+    specifies a cheap validator that returns the ``Content-Length``
+    of the unrendered response to a ``HEAD`` request. As with `etag`,
+    it is either a callable or the name of a controller method, and
+    is called with the `request`.
+
   Examples::
 
     class MyController(Controller):
@@ -181,6 +259,37 @@ index = makeDecorator(IndexDecorator, doc='''\
     modify bindings provided by the RestController, so this parameter
     should typically not be used on subclasses of RestController.
 
+  rest : bool, default: false
+
+    Primarily for internal purposes (it is used by RestController):
+    when set to truthy, the dispatcher first resolves the request's
+    HTTP method to the @expose'd handler of the same (lower-cased)
+    name, and only invokes the decorated method if there is none.
+
+  cache : { bool, int, dict }, optional
+
+    Enables server-side response caching; see @expose.
+
+  etag : { callable, str }, optional
+
+    Enables conditional requests via an entity tag validator; see
+    @expose.
+
+  lastModified : { callable, str }, optional
+
+    Enables conditional requests via a last-modified validator; see
+    @expose.
+
+  head : bool, default: false
+
+    Controls rendering of ``HEAD`` requests in `fastHead` mode; see
+    @expose.
+
+  contentLength : { callable, str }, optional
+
+    Specifies the ``Content-Length`` of ``HEAD`` requests in
+    `fastHead` mode; see @expose.
+
   Examples::
 
     class SubController(Controller):
@@ -225,6 +334,10 @@ default = makeDecorator(DefaultDecorator, doc='''\
     modify bindings provided by the RestController, so this parameter
     should typically not be used on subclasses of RestController.
 
+  cache : { bool, int, dict }, optional
+
+    Enables server-side response caching; see @expose.
+
   Examples::
 
     class SubController(Controller):
@@ -279,8 +392,21 @@ lookup = makeDecorator(LookupDecorator, doc='''\
   of walking the request URL path components. It should return a tuple
   of ``(Controller, remainingPaths)``, where `remainingPaths` is a
   list of path elements that were not consumed (the @lookup method can
-  consume as many elements as needed). The @lookup decorator itself
-  does not currently accept any parameters.
+  consume as many elements as needed).
+
+  :Parameters:
+
+  cache : { bool, dict, LookupCache }, optional
+
+    Enables memoization of the lookup results: the returned controller
+    and the request attributes listed in `attrs` are cached, keyed by
+    the controller class and the path components that the handler
+    consumes (i.e. one per named positional parameter after
+    `request`). If a dict, it specifies the
+    :class:`pyramid_controllers.LookupCache` parameters `size`
+    (default: 1024), `ttl` (in seconds, default: no expiry) and `attrs`
+    (default: none). Pass a LookupCache instance to be able to
+    invalidate entries, e.g. when the underlying resource changes.
 
   The lookup handler is typically used for dynamically resolved URL
   components which identify, usually, an object ID. This is the most
@@ -313,7 +439,18 @@ lookup = makeDecorator(LookupDecorator, doc='''\
   In this example, assuming that ``get_resource_by_id`` returns an
   object by ID, the request for URL ``/resource/15/action`` will
   receive the response ``Action taken on object ID "15".`` (given that
-  the object with ID "15" exists).
+  the object with ID "15" exists). To avoid loading the resource on
+  every request, the lookup could be cached for up to a minute with::
+
+    resources = LookupCache(ttl=60, attrs=('res',))
+
+    class ResourceDispatcher(Controller):
+
+      @lookup(cache=resources)
+      def lookup(self, request, res_id, *rem):
+        ...
+
+  and calling ``resources.invalidate(res_id)`` when a resource changes.
   ''')
 
 #------------------------------------------------------------------------------
@@ -391,43 +528,31 @@ wrap = makeDecorator(WrapDecorator, doc='''\
 class ClassDecoration(object):
   def __init__(self):
     self.defaults = []
-    self.meta     = None
-  def apply(self, wrapped):
-    for defs in reversed(self.defaults):
-      # todo: this `defs.method` rewrite should really be handled only by
-      #       the Decoration class (instead of replicating here...)
-      if defs.method:
-        if isstr(defs.method):
-          defs.method = [defs.method]
-        defs.method = set([e.upper() for e in defs.method])
-      if 'ext' in defs:
-        if defs.ext is None or isstr(defs.ext):
-          defs.ext = [defs.ext]
-      for name, attr in inspect.getmembers(wrapped):
-        apc = getattr(attr, PCATTR, None)
-        if not apc:
-          continue
-        for dectype in ( 'expose', 'index', 'default' ):
-          for spec in getattr(apc, dectype, []):
-            for decattr in ( 'renderer', 'method' ):
-              if decattr in defs and decattr not in spec:
-                setattr(spec, decattr, getattr(defs, decattr))
-        for dectype in ( 'expose', ):
-          for spec in getattr(apc, dectype, []):
-            for decattr in ( 'ext', ):
-              if decattr in defs and decattr not in spec:
-                setattr(spec, decattr, getattr(defs, decattr))
 
 #------------------------------------------------------------------------------
 class ExposeDefaultsDecorator(object):
   def __init__(self, **kw):
     self.kw = adict(kw)
+    # todo: this `method` rewrite should really be handled only by
+    #       the Decorator class (instead of replicating here...)
+    if self.kw.method:
+      if isstr(self.kw.method):
+        self.kw.method = [self.kw.method]
+      self.kw.method = set([e.upper() for e in self.kw.method])
+    if 'ext' in self.kw:
+      if self.kw.ext is None or isstr(self.kw.ext):
+        self.kw.ext = [self.kw.ext]
   def __call__(self, wrapped):
-    if not hasattr(wrapped, PCCTRLATTR):
-      setattr(wrapped, PCCTRLATTR, ClassDecoration())
-    pc = getattr(wrapped, PCCTRLATTR)
+    # note: the decoration is stored in the class's own namespace so
+    #       that decorating a subclass does not alter its base classes.
+    #       the defaults are applied by the Dispatcher when it compiles
+    #       the controller metadata (the methods' decorations are never
+    #       modified).
+    pc = vars(wrapped).get(PCCTRLATTR)
+    if pc is None:
+      pc = ClassDecoration()
+      setattr(wrapped, PCCTRLATTR, pc)
     pc.defaults.append(self.kw)
-    pc.apply(wrapped)
     return wrapped
 
 #------------------------------------------------------------------------------
@@ -473,6 +598,11 @@ def expose_defaults(*args, **kw):
     any @index, @default, and @expose decorated methods that do not
     have a pre-existing `method` definition will inherit this value.
 
+  cache : { bool, int, dict }, optional
+
+    any @index, @default, and @expose decorated methods that do not
+    have a pre-existing `cache` definition will inherit this value.
+
   dashUnder : bool, optional
 
     any @expose that does not explicitly set a `dashUnder` value
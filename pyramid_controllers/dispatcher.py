@@ -17,40 +17,112 @@ algorithm of the controller-based request dispatch mechanism.
 #       an @default receives ``None`` as the current path element
 #       being requested instead of ''... is that what it should be?...
 
-import os.path
 import types
 import re
 import inspect
+import random
 import types
+import functools
+import threading
+import time
+import timeit
 
 import six
-from six.moves import urllib
 from pyramid.exceptions import ConfigurationError
 from pyramid.response import Response
 from pyramid.httpexceptions import HTTPException, HTTPError
 from pyramid.httpexceptions import HTTPFound, HTTPNotFound, HTTPForbidden
-from pyramid.renderers import render_to_response
+from pyramid.httpexceptions import HTTPNotModified, HTTPMethodNotAllowed
+from webob.datetime_utils import parse_date, serialize_date
+from pyramid.renderers import render_to_response, RendererHelper, JSON
+from pyramid.renderers import string_renderer_factory
+from pyramid.interfaces import IRendererFactory
+from pyramid.events import BeforeRender
+from zope.interface import implementedBy
+from pyramid.threadlocal import get_current_registry
 
 from .controller import Controller
 from . import decorator
-from .util import adict, isstr
+from .util import adict, isstr, getMethod, splitPath, HTTP_METHODS, meth2action
+from .cache import LRUCache, MemoryResponseCache
+from .stream import isStream, iterChunks, makeJsonDefault, NDJSON
+
+try:
+  from pyramid.util import hide_attrs
+except ImportError:
+  # pyramid < 1.6: `render_to_response` renders into `request.response`
+  hide_attrs = None
 
 path2meth = re.compile('[^a-zA-Z0-9_]')
 
+_timer = timeit.default_timer
+
 #------------------------------------------------------------------------------
 class ControllerError(Exception): pass
 
+#------------------------------------------------------------------------------
+def getDispatchContext(request):
+  '''
+  Returns the dispatch context of `request`, i.e. the adict that the
+  :class:`Dispatcher` attaches to a request while walking it, or
+  ``None`` if `request` is not being dispatched. The context provides
+  the following attributes:
+
+  * `dispatcher`: the Dispatcher handling the request.
+  * `root`: the root controller that the request is dispatched to.
+  * `controller`: the controller currently being walked.
+  * `remainder`: the path components that have not been consumed yet.
+  * `trace`: if the request was sampled for tracing (see the
+    Dispatcher's `traceRate` parameter), the list of walk decisions,
+    otherwise ``None``. Each decision is an adict with the attributes
+    `event`, `controller` (the controller class name), and depending
+    on the event, `segment`, `target`, `accepted` and `reason`.
+  '''
+  return getattr(request, Dispatcher.CTXATTR, None)
+
+#------------------------------------------------------------------------------
+def getDispatcher(request):
+  '''
+  Returns the :class:`Dispatcher` that is currently dispatching
+  `request`, or ``None`` if there is none.
+  '''
+  ctxt = getattr(request, Dispatcher.CTXATTR, None)
+  if ctxt is None:
+    return None
+  return ctxt.dispatcher
+
 #------------------------------------------------------------------------------
 def getDispatcherFromStack():
-  # TODO: is this efficient? is this cross-platform? is this causing
-  #       reference cycles?... oh dear! make sure this is really the
-  #       best way.
+  '''
+  DEPRECATED -- inspects the entire call stack (which is *very*
+  expensive) to find the active Dispatcher. Please use
+  :func:`getDispatcher` instead.
+  '''
   for frame in inspect.stack():
     d = frame[0].f_locals.get('self', None)
     if isinstance(d, Dispatcher):
       return d
   return None
 
+#------------------------------------------------------------------------------
+def _callWrapper(wrapper, handler, request):
+  return wrapper(request, handler)
+
+def _callHandler(handler, args, params, request):
+  return handler(request, *args, **params)
+
+def _timeHandler(events, controller, handler, request, *args, **params):
+  start = _timer()
+  try:
+    return handler(request, *args, **params)
+  finally:
+    events.append(('handler', _timer() - start, controller, handler))
+
+def _controllerClass(controller):
+  if type(controller) in (types.TypeType, types.ClassType):
+    return controller
+  return type(controller)
+
 #------------------------------------------------------------------------------
 class Dispatcher(object):
   '''
@@ -59,6 +131,7 @@ class Dispatcher(object):
   '''
 
   PCATTR = '__pyramid_controllers__'
+  CTXATTR = 'pyramid_controllers'
   NAME_INDEX   = ''
   NAME_DEFAULT = '*'
   NAME_LOOKUP  = '...'
@@ -66,7 +139,9 @@ class Dispatcher(object):
   #----------------------------------------------------------------------------
   def __init__(self,
                defaultForceSlash=True, raiseType=HTTPError, autoDecorate=True,
-               defaultDashUnder=True,
+               defaultDashUnder=True, chainCacheSize=1024, pathCacheSize=1024,
+               planCacheSize=0, instrument=None, traceRate=0, responseCache=None,
+               autoOptions=False, fastHead=False, fastJson=False,
                raiseErrors=None, # DEPRECATED
                *args, **kw):
     '''
@@ -112,6 +187,109 @@ class Dispatcher(object):
       5xx status codes will be rolled back IFF (if and only if) the
       x-tm:commit header is not set.
 
+    chainCacheSize : int, default: 1024
+
+      The maximum number of composed @wrap chains that are cached (and
+      re-used for subsequent requests) per unique combination of
+      wrappers and handler. Chains that involve per-request controllers
+      (i.e. ones that were instantiated or returned by a @lookup) are
+      never cached. Set to zero to disable caching.
+
+    pathCacheSize : int, default: 1024
+
+      The maximum number of normalized and split request paths that
+      are cached (keyed on the raw ``pyramid_controllers_path``) in a
+      least-recently-used cache. Set to zero to disable caching.
+
+    planCacheSize : int, default: 0
+
+      The maximum number of resolution "plans" that are cached in a
+      least-recently-used cache. A plan records the outcome of walking
+      the controller tree for a given root controller, HTTP method and
+      request path (i.e. the fiddlers to run, the wrappers, the handler
+      and its rendering parameters), so that repeat requests skip the
+      tree walk entirely. Only paths that resolve without any @lookup,
+      @default or per-request controller instantiation are cached.
+      Note that plans assume that @fiddle methods do not alter any
+      request attributes that influence the resolution (such as the
+      request method). Defaults to zero, i.e. disabled. See
+      :meth:`invalidate`.
+
+    instrument : pyramid_controllers.instrument.Instrument, default: null
+
+      An object whose ``record(request, phase, elapsed, controller,
+      route, target)`` method receives timing events for each dispatch
+      phase (path normalization, each fiddler, each lookup, the @wrap
+      chain, the handler and rendering), tagged with the controller
+      class and the resolved route pattern. The events of a request
+      are delivered when its dispatch completes. See
+      :class:`pyramid_controllers.instrument.Instrument` for details.
+
+    traceRate : float, default: 0
+
+      The fraction of requests (from 0, i.e. none, to 1, i.e. all)
+      that are randomly sampled for tracing. The walk of a sampled
+      request records each decision made (the path segments resolved,
+      the candidates tried and why they were rejected, the fiddlers
+      run, and the @lookup, @default or @index handlers that fired) in
+      the ``trace`` attribute of the dispatch context (see
+      :func:`getDispatchContext`).
+
+    responseCache : pyramid_controllers.cache.ResponseCache, default: null
+
+      The backend that stores the responses of handlers that declare
+      a `cache` (see @expose). Defaults to an in-memory
+      :class:`pyramid_controllers.cache.MemoryResponseCache` of 1024
+      entries; its metrics are available via its ``stats()`` method.
+
+    autoOptions : bool, default: false
+
+      If truthy, ``OPTIONS`` requests (including CORS preflight
+      requests) are answered by the dispatcher itself from the
+      compiled set of HTTP methods that the resolved resource accepts
+      (see :meth:`getAllowedMethods` and :meth:`makeOptionsResponse`):
+      @fiddle, @wrap and any ``OPTIONS`` handlers are not invoked
+      (note that @lookup handlers are, since they are needed to
+      resolve the resource).
+
+    fastHead : bool, default: false
+
+      If truthy, ``HEAD`` requests are resolved to the handlers that
+      accept ``GET`` requests (including a RestController's ``get``
+      verb handler if it does not have a ``head`` one), and the
+      handler's result is not rendered: the response has the same
+      status and headers as the rendered response would, except that
+      it has a ``Content-Length`` only if the handler declares a
+      `contentLength` validator. This only applies to the renderers
+      that set the content type independently of the rendered value
+      (i.e. ``json``, ``string``, ``ndjson`` and ``jsonstream``);
+      the results of other renderers, and of handlers that declare
+      ``head=True`` (see @expose), are rendered normally. Handlers
+      that return a Response or a string are not affected.
+
+    fastJson : { bool, callable }, default: false
+
+      If truthy, the results of handlers that declare
+      ``renderer='json'`` are serialized directly into
+      ``request.response`` instead of via pyramid's generic renderer
+      machinery (i.e. without creating the renderer's system values
+      or calling the renderer per request); the response is otherwise
+      identical to the one that the ``json`` renderer produces. If
+      `fastJson` is a callable, it is used as the JSON encoder instead
+      of the renderer's `serializer`: it is called with the value and
+      the keyword argument `default`, the callback that converts
+      objects via their ``__json__`` method or the adapters added to
+      the registered ``json`` renderer (the renderer's other keyword
+      arguments are not passed), and must return a string. For
+      example, ``simplejson.dumps`` or ``orjson.dumps``; encoders that
+      do not support `default`, e.g. ``ujson.dumps`` before ujson 5.4,
+      must be wrapped (e.g. ``lambda value, default: ujson.dumps(value)``),
+      in which case the adapters are not available. The fast path is
+      only taken if the ``json`` renderer factory is a
+      (non-subclassed) :class:`pyramid.renderers.JSON` and no
+      ``BeforeRender`` event subscribers are registered; otherwise the
+      result is rendered normally.
+
     raiseErrors : bool, DEPRECATED, default: null
 
       DEPRECATED -- only here for backward compatibility. Please use
@@ -120,9 +298,10 @@ class Dispatcher(object):
     autoDecorate : bool, default: true
 
       Primarily for internal purposes -- when set to truthy (the
-      default), the result of doing a controller exposure instance
-      inspection will be cached as an attribute on the controller
-      (named the value of ``self.PCATTR``).
+      default), the result of doing a controller exposure inspection
+      will be cached, per controller class, in this dispatcher and
+      referenced by an attribute on the controller instance (named the
+      value of ``self.PCATTR``).
 
     Note: the standard dispatcher assumes that URL-encoded client
     paths will remain URL-encoded until they get to the Dispatcher.
@@ -140,33 +319,335 @@ class Dispatcher(object):
     if raiseType is HTTPError and raiseErrors is not None:
       self.raiseType         = HTTPError if raiseErrors else ()
     self.autoDecorate      = autoDecorate
+    self.chainCacheSize    = chainCacheSize
+    self.chains            = dict()
+    self.helpers           = dict()
+    self.metas             = dict()
+    self.lock              = threading.RLock()
+    self.paths             = LRUCache(pathCacheSize) if pathCacheSize else None
+    self.plans             = LRUCache(planCacheSize) if planCacheSize else None
+    self.instrument        = instrument
+    self.traceRate         = traceRate
+    self.responseCache     = responseCache
+    if responseCache is None:
+      self.responseCache     = MemoryResponseCache()
+    self.autoOptions       = autoOptions
+    self.fastHead          = fastHead
+    self.fastJson          = fastJson
+    self.jsonFactories     = dict()
 
   #----------------------------------------------------------------------------
   def makeMeta(self, controller):
-    meta = adict(fiddle=[], wrap=[], expose={}, index=[], lookup=[], default=[])
-    cpc = getattr(controller, decorator.PCCTRLATTR, None)
-    # TODO: this call has side-effects!... modify this so that it doesn't.
-    if cpc:
-      cpc.apply(controller)
-    for name, attr in inspect.getmembers(controller):
+    '''
+    Inspects `controller`, which is typically a Controller subclass
+    but can also be an instance, and compiles the dispatch metadata.
+    Note that handlers are referenced by attribute *name* (and not by
+    value) in all the compiled structures so that the metadata of a
+    class can be shared by all of its instances.
+
+    The decorations themselves are never modified: the effective
+    specification of each decoration (i.e. with the applicable
+    @expose_defaults merged in and the exposed names resolved) is a
+    copy that is stored in the ``specs`` attribute of the returned
+    metadata, keyed by attribute name. The returned metadata is fully
+    built before it is returned and is not modified thereafter, which
+    allows it to be shared between threads without locking.
+    '''
+    cls      = _controllerClass(controller)
+    defaults = self._getDefaults(cls)
+    names    = adict(fiddle=[], wrap=[], lookup=[], default=[], index=[])
+    expose   = dict()
+    specs    = dict()
+    funcs    = dict()
+    dynamic  = set()
+    members  = inspect.getmembers(controller)
+    for name, attr in members:
       apc = getattr(attr, self.PCATTR, None)
-      if not apc:
+      if not isinstance(apc, decorator.MethodDecoration):
+        if self._isDynamic(attr):
+          dynamic.add(name)
         continue
-      for dectype in ('fiddle', 'wrap', 'lookup', 'default', 'index'):
-        if getattr(apc, dectype, []):
-          meta[dectype].append(attr)
-      for exp in apc.expose or []:
-        exp.name = self._handler_names(name, exp)
-        exp.ext = None
+      owner = self._getOwner(cls, name)
+      if owner is None or owner is cls:
+        aspecs = self._compileSpecs(name, apc, defaults, self.getPackageName(attr))
+      else:
+        aspecs = self._compileSpecs(
+          name, apc, self._getDefaults(owner) + defaults, self.getPackageName(attr))
+      specs[name] = aspecs
+      funcs.setdefault(getattr(attr, '__func__', attr), aspecs)
+      for dectype in names.keys():
+        if aspecs[dectype]:
+          names[dectype].append(name)
+      for exp in aspecs.expose:
         for ename in exp.name:
-          if ename not in meta.expose:
-            meta.expose[ename] = []
-          meta.expose[ename].append(attr)
+          if ename not in expose:
+            expose[ename] = []
+          expose[ename].append(name)
+    attrs = dict(members)
+    meta  = adict({dectype: tuple(attrnames) for dectype, attrnames in names.items()})
+    meta.expose  = {ename: tuple(attrnames) for ename, attrnames in expose.items()}
+    meta.specs   = specs
+    meta.funcs   = funcs
+    meta.dynamic = frozenset(dynamic)
+    meta.table   = self._makeTable(attrs, meta)
+    meta.ops     = adict({dectype: self._makeOps(specs, meta[dectype], dectype)
+                          for dectype in names.keys()})
+    meta.verbs   = dict()
+    for method in HTTP_METHODS:
+      action = meth2action(method)
+      meta.verbs[method] = (action, meta.table.get(action, ()))
+    if self.fastHead and not meta.verbs['HEAD'][1]:
+      meta.verbs['HEAD'] = meta.verbs['GET']
+    meta.allowed = self._makeAllowed(meta)
     return meta
 
+  #----------------------------------------------------------------------------
+  def _makeAllowed(self, meta):
+    '''
+    Compiles the sets of HTTP methods that the handlers of a controller
+    accept, given its partially built `meta`, into an adict with the
+    attributes `index` (for index requests), `default` (for requests
+    that are only handled by @default handlers), `segments` (a dict
+    that maps each dispatch table segment to its set) and `verbs`
+    (the methods that resolve to a RestController verb handler). See
+    :meth:`getAllowedMethods`.
+    '''
+    anyMethod = frozenset(HTTP_METHODS)
+    def union(methodsets):
+      ret = set()
+      for methods in methodsets:
+        ret.update(anyMethod if methods is None else methods)
+      return frozenset(ret)
+    verbs = frozenset(
+      method for method, (action, cands) in meta.verbs.items()
+      if any(methods is None or method in methods for name, methods in cands))
+    default = union(
+      spec.method or None for name in meta.default for spec in meta.specs[name].default)
+    index = union(
+      verbs if spec.rest else ( spec.method or None )
+      for name in meta.index for spec in meta.specs[name].index)
+    segments = {
+      segment: union(methods for name, methods in cands) | default
+      for segment, cands in meta.table.items()}
+    return adict(index=index | default, default=default, segments=segments, verbs=verbs)
+
+  #----------------------------------------------------------------------------
+  def _getDefaults(self, cls):
+    # returns the list of @expose_defaults that apply to the handlers
+    # of `cls`, in order of precedence: a class's own defaults take
+    # precedence over its base classes', and within a class, the
+    # outermost decorator wins
+    ret = []
+    for klass in inspect.getmro(cls):
+      cpc = vars(klass).get(decorator.PCCTRLATTR)
+      if cpc is not None:
+        ret.extend(reversed(cpc.defaults))
+    return ret
+
+  #----------------------------------------------------------------------------
+  def _getOwner(self, cls, name):
+    # returns the class in the MRO of `cls` that defines `name`
+    for klass in inspect.getmro(cls):
+      if name in vars(klass):
+        return klass
+    return None
+
+  #----------------------------------------------------------------------------
+  def _compileSpecs(self, name, decoration, defaults, package=None):
+    '''
+    Returns an adict that maps each decoration type (e.g. ``expose``)
+    to the tuple of effective specifications of the method decorated
+    by `decoration` and named `name`, given the list of applicable
+    @expose_defaults `defaults` (in order of precedence) and the name
+    of the `package` that defines the method (which is used to
+    resolve relative renderer names). The specs in `decoration` are
+    copied, not modified. The additional attributes
+    `cache` and `validate` are truthy if any of the @expose, @index or
+    @default specs declare a response cache or a conditional request
+    validator (i.e. an `etag` or `lastModified`), respectively.
+    '''
+    ret = adict()
+    for dectype in ('fiddle', 'wrap', 'lookup', 'default', 'index', 'expose'):
+      ret[dectype] = tuple(
+        self._compileSpec(name, dectype, spec, defaults, package)
+        for spec in getattr(decoration, dectype, None) or [])
+    specs = [spec for dectype in ('expose', 'index', 'default') for spec in ret[dectype]]
+    ret.cache    = any(spec.cache for spec in specs)
+    ret.validate = any(spec.etag or spec.lastModified for spec in specs)
+    return ret
+
+  #----------------------------------------------------------------------------
+  def _compileSpec(self, name, dectype, spec, defaults, package):
+    spec = adict(spec)
+    if dectype in ('expose', 'index', 'default'):
+      spec.package = package
+      decattrs = ( 'renderer', 'method', 'cache', 'ext' ) if dectype == 'expose' \
+        else ( 'renderer', 'method', 'cache' )
+      for defs in defaults:
+        for decattr in decattrs:
+          if decattr in defs and decattr not in spec:
+            spec[decattr] = defs[decattr]
+      if self.fastHead and spec.method and 'GET' in spec.method:
+        spec.method = spec.method | set(['HEAD'])
+      if spec.cache:
+        spec.cache = self._compileCache(spec.cache)
+    if dectype == 'expose':
+      spec.name = self._handler_names(name, spec)
+      spec.ext  = None
+    return spec
+
+  #----------------------------------------------------------------------------
+  def _compileCache(self, cache):
+    # normalizes an @expose `cache` declaration to an adict with the
+    # attributes `ttl` and `vary`
+    if cache is True:
+      return adict(ttl=None, vary=())
+    if isinstance(cache, six.integer_types + (float,)):
+      return adict(ttl=cache, vary=())
+    vary = cache.get('vary') or ()
+    if isstr(vary):
+      vary = ( vary, )
+    return adict(ttl=cache.get('ttl'), vary=tuple(vary))
+
+  #----------------------------------------------------------------------------
+  def getSpecs(self, controller, handler):
+    '''
+    Returns the effective decoration specifications (see
+    :meth:`makeMeta`) of the handler method `handler` of `controller`
+    as an adict keyed by decoration type, or ``None`` if `handler` is
+    not decorated.
+    '''
+    ret = self.getMeta(controller).funcs.get(getattr(handler, '__func__', handler))
+    if ret is not None:
+      return ret
+    # the handler was not a member at compile time, i.e. it was
+    # provided by a descriptor or is not an attribute at all
+    apc = getattr(handler, self.PCATTR, None)
+    if not isinstance(apc, decorator.MethodDecoration):
+      return None
+    return self._compileSpecs(
+      getattr(handler, '__name__', ''), apc,
+      self._getDefaults(_controllerClass(controller)), self.getPackageName(handler))
+
+  #----------------------------------------------------------------------------
+  def _isDynamic(self, attr):
+    # returns True if `attr` is a non-builtin descriptor (such as a
+    # property), i.e. its value can only be determined per instance
+    if isinstance(attr, property):
+      return True
+    if isinstance(attr, (Controller, types.FunctionType, types.MethodType)) \
+        or type(attr) in (types.TypeType, types.ClassType):
+      return False
+    return hasattr(type(attr), '__get__') \
+      and type(attr).__module__ not in ('__builtin__', 'builtins')
+
+  #----------------------------------------------------------------------------
+  def _makeTable(self, attrs, meta):
+    '''
+    Compiles the dispatch table of a controller, given its `attrs`
+    (a dict of its members) and the partially built `meta`. The table
+    is a dict that maps each reachable path segment to a tuple of
+    ``(name, methods)`` candidates, in resolution order: the attribute
+    by the same name, then the dash-to-underscore attribute variant,
+    and finally all the @expose aliases. `methods` is either ``None``
+    (any HTTP method is acceptable) or the set of HTTP methods that
+    the candidate accepts.
+    '''
+    segments = set(meta.expose.keys())
+    for name in attrs.keys():
+      segments.add(name)
+      if '_' in name:
+        segments.add(name.replace('_', '-'))
+    table = dict()
+    for segment in segments:
+      cands = [(segment, self._makeCandidate(
+        segment, attrs.get(segment), meta.specs.get(segment)))]
+      if '-' in segment:
+        name = segment.replace('-', '_')
+        cands.append((name, self._makeCandidate(
+          segment, attrs.get(name), meta.specs.get(name), checkDashUnder=True)))
+      for name in meta.expose.get(segment, []):
+        cands.append((name, self._makeCandidate(
+          segment, attrs.get(name), meta.specs.get(name))))
+      entry = []
+      for name, methods in cands:
+        if methods is not False and (name, methods) not in entry:
+          entry.append((name, methods))
+      if entry:
+        table[segment] = tuple(entry)
+    return table
+
+  #----------------------------------------------------------------------------
+  def _makeOps(self, specs, names, dectype):
+    '''
+    Compiles the handlers of type `dectype`, named `names`, given the
+    effective `specs` of each handler (see :meth:`makeMeta`), into a
+    dict that maps an HTTP method to a tuple of ``(ops, names)``,
+    where `ops` is the ordered tuple of ``(name, spec)`` pairs that
+    apply to requests with that method. The ``None`` key is the bucket
+    that applies to any method not explicitly listed.
+    '''
+    specs   = [(name, specs[name][dectype]) for name in names]
+    methods = set()
+    if dectype in ('index', 'default'):
+      for name, speclist in specs:
+        for spec in speclist:
+          methods.update(spec.method or [])
+    ret = dict()
+    for method in [None] + sorted(methods):
+      ops = []
+      for name, speclist in specs:
+        for spec in speclist:
+          if method is None and spec.method and dectype in ('index', 'default'):
+            continue
+          if method is not None and spec.method and method not in spec.method:
+            continue
+          ops.append((name, spec))
+          break
+      ret[method] = (tuple(ops), tuple(op[0] for op in ops))
+    return ret
+
+  #----------------------------------------------------------------------------
+  def _makeCandidate(self, segment, handler, specs, checkDashUnder=False):
+    # returns the set of acceptable HTTP methods if `handler`, with the
+    # effective decoration `specs`, can handle `segment` (``None`` if
+    # any method is acceptable) or ``False``
+    if handler is None:
+      return False
+    if isinstance(handler, Controller):
+      # todo: should this be `filtered` instead?...
+      # todo: what if this is aliased...
+      if handler._pyramid_controllers.expose is not True:
+        return False
+      if checkDashUnder \
+         and ( handler._pyramid_controllers.dashUnder is False
+               or ( handler._pyramid_controllers.dashUnder is not True
+                    and not self.defaultDashUnder )
+         ):
+        return False
+      return None
+    if type(handler) in (types.TypeType, types.ClassType):
+      # TODO: check that type(handler()) == Controller...
+      # TODO: check handler()._pyramid_controllers.expose is True...
+      return None
+    if not specs:
+      return False
+    methods = set()
+    matched = False
+    for spec in specs.expose:
+      if spec.name and segment not in spec.name:
+        continue
+      matched = True
+      if not spec.method:
+        return None
+      methods.update(spec.method)
+    if not matched:
+      return False
+    return frozenset(methods)
+
   #----------------------------------------------------------------------------
   def _handler_names(self, name, spec):
-    names = spec.name if spec.name else [ name ]
+    names = list(spec.name) if spec.name else [ name ]
     if isinstance(names, six.string_types):
       names = [ names ]
     if '_' in name \
@@ -184,19 +665,71 @@ class Dispatcher(object):
 
   #----------------------------------------------------------------------------
   def getMeta(self, controller):
+    '''
+    Returns the compiled dispatch metadata for `controller`. The
+    metadata is compiled once per controller class and shared by all
+    instances (so instantiating a controller per request is cheap),
+    unless the instance itself carries handlers or sub-controllers as
+    instance attributes, in which case the instance is inspected
+    directly. If `autoDecorate` is enabled, the resolved metadata is
+    cached on the controller instance.
+
+    This method is thread-safe: the metadata of a given class (or
+    instance) is compiled exactly once, even if concurrent requests
+    reach it at the same time, and is only published (i.e. made
+    visible to other threads) once it is complete.
+    '''
     if not self.autoDecorate:
       return self.makeMeta(controller)
-    # TODO: how to avoid this object attribute pollution?...
     # TODO: what if this controller uses dynamically generated methods
     #       or __getitem__?...
-    pc = getattr(controller, self.PCATTR, None)
-    if pc is None:
-      pc = adict()
-      setattr(controller, self.PCATTR, pc)
-    if pc.meta is not None:
+    if isinstance(controller, (type, types.ClassType)):
+      return self.getClassMeta(controller)
+    idict = getattr(controller, '__dict__', None)
+    if idict is None:
+      return self.getClassMeta(type(controller))
+    pc = idict.get(self.PCATTR)
+    if pc is not None and pc.dispatcher is self:
       return pc.meta
-    pc.meta = self.makeMeta(controller)
-    return pc.meta
+    if not self._hasInstanceHandlers(idict):
+      meta = self.getClassMeta(type(controller))
+      idict[self.PCATTR] = adict(dispatcher=self, meta=meta)
+      return meta
+    with self.lock:
+      pc = idict.get(self.PCATTR)
+      if pc is not None and pc.dispatcher is self:
+        return pc.meta
+      meta = self.makeMeta(controller)
+      idict[self.PCATTR] = adict(dispatcher=self, meta=meta)
+    return meta
+
+  #----------------------------------------------------------------------------
+  def getClassMeta(self, cls):
+    '''
+    Returns the compiled dispatch metadata for the controller class
+    `cls` (see :meth:`getMeta`).
+    '''
+    meta = self.metas.get(cls)
+    if meta is not None:
+      return meta
+    with self.lock:
+      meta = self.metas.get(cls)
+      if meta is None:
+        # note: the metadata is only published once it is complete
+        meta = self.makeMeta(cls)
+        self.metas[cls] = meta
+    return meta
+
+  #----------------------------------------------------------------------------
+  def _hasInstanceHandlers(self, idict):
+    for name, attr in idict.items():
+      if name == self.PCATTR:
+        continue
+      if isinstance(attr, Controller) \
+          or type(attr) in (types.TypeType, types.ClassType) \
+          or getattr(attr, self.PCATTR, None):
+        return True
+    return False
 
   #----------------------------------------------------------------------------
   def _filter(self, request, response, controller, handler, dectype, spec, remainder):
@@ -230,19 +763,12 @@ class Dispatcher(object):
   def _getOp(self, request, controller, dectype, remainder, multi=False):
     if not isinstance(controller, Controller):
       raise TypeError('get-op called on non-controller')
-    meta = self.getMeta(controller)
-    ret = []
-    for handler in meta[dectype]:
-      apc = getattr(handler, self.PCATTR, None)
-      if not apc:
-        continue
-      spec = self._select(request, None, controller, handler, dectype, remainder, getattr(apc, dectype, []))
-      if spec is not None:
-        if not multi:
-          return (handler, spec)
-        ret.append(handler)
+    ops = self.getMeta(controller).ops[dectype]
+    ops, names = ops.get(request.method) or ops[None]
     if multi:
-      return (ret, None)
+      return ([getattr(controller, name) for name in names], None)
+    if ops:
+      return (getattr(controller, ops[0][0]), ops[0][1])
     return (None, None)
 
   #----------------------------------------------------------------------------
@@ -269,10 +795,10 @@ class Dispatcher(object):
     '''
     meta = self.getMeta(controller)
     for meth in meta.index:
-      yield (self.NAME_INDEX, meth)
+      yield (self.NAME_INDEX, getattr(controller, meth))
     names = dict()
     for name, curexp in meta.expose.items():
-      names[name] = curexp[:]
+      names[name] = [getattr(controller, attr) for attr in curexp]
     # todo: it would probably be better to create a subclass of
     #       dict() that does this directly...
     def appto(name, attr):
@@ -294,24 +820,14 @@ class Dispatcher(object):
         # todo: check handler()._pyramid_controllers.expose is True...
         appto(name, attr)
         continue
-      if not callable(attr):
-        continue
-      apc = getattr(attr, self.PCATTR, None)
-      if not apc:
-        continue
-      for exp in apc.expose or []:
-        # todo: what about `dashUnder` implications?...
-        if exp.name:
-          continue
-        appto(name, attr)
     for name in sorted(names.keys(), cmp=sortcmp):
       for attr in names[name]:
         yield (name, attr)
     for meth in meta.default:
-      yield (self.NAME_DEFAULT, meth)
+      yield (self.NAME_DEFAULT, getattr(controller, meth))
     if not hasIndirect:
       for meth in meta.lookup:
-        yield (self.NAME_LOOKUP, meth)
+        yield (self.NAME_LOOKUP, getattr(controller, meth))
 
   #----------------------------------------------------------------------------
   def getFiddlers(self, request, controller, remainder):
@@ -323,75 +839,95 @@ class Dispatcher(object):
 
   #----------------------------------------------------------------------------
   def getIndexHandler(self, request, controller, remainder):
+    return self._getIndexOp(request, controller, remainder)[0]
+
+  #----------------------------------------------------------------------------
+  def _getIndexOp(self, request, controller, remainder):
     handler, spec = self._getOp(request, controller, 'index', remainder)
     if not handler:
-      return None
+      return (None, None)
     # check that the path ends in a '/' (which is the case if the last
     # path segment is '') - if not, check `forceSlash`...
     if ( len(remainder) == 1 and remainder[0] == '' ) \
           or spec.forceSlash is False:
-      return handler
+      return (handler, spec)
     if spec.forceSlash or self.defaultForceSlash:
       # todo: is this really the best way?...
       url = request.path + '/'
       if request.query_string:
         url += '?' + request.query_string
       raise HTTPFound(location=url)
-    return handler
+    return (handler, spec)
 
   #----------------------------------------------------------------------------
-  def _filterNext(self, request, controller, remainder, handler, checkDashUnder=False):
-    # TODO: this `checkDashUnder`... a total hack.
-    if not handler:
-      return None
-    if isinstance(handler, Controller):
-      # todo: should this be `filtered` instead?...
-      # todo: what if this is aliased...
-      if handler._pyramid_controllers.expose is not True:
-        return None
-      if checkDashUnder \
-         and ( handler._pyramid_controllers.dashUnder is False
-               or ( handler._pyramid_controllers.dashUnder is not True
-                    and not self.defaultDashUnder )
-         ):
-        return None
-      return handler
-    if type(handler) in (types.TypeType, types.ClassType):
-      # TODO: check that type(handler()) == Controller...
-      # TODO: check handler()._pyramid_controllers.expose is True...
-      return handler
-    pc = getattr(handler, self.PCATTR, None)
-    if not pc:
-      return None
-    for spec in pc.expose:
-      spec = self._filter(request, None, controller, handler, 'expose', spec, remainder)
-      if spec is not None:
-        return handler
-    return None
+  def getVerbHandler(self, request, controller):
+    '''
+    Resolves the HTTP method of `request` (see
+    :func:`pyramid_controllers.util.getMethod`) to the handler exposed
+    by `controller` under the corresponding action name (e.g. ``PUT``
+    maps to ``put``). Returns a tuple of ``(handler, action)``, where
+    `handler` is ``None`` if there is no such handler.
+    '''
+    method = getMethod(request)
+    meta   = self.getMeta(controller)
+    verb   = meta.verbs.get(method)
+    if verb is None:
+      action = meth2action(method)
+      verb   = (action, meta.table.get(action, ()))
+    action, cands = verb
+    for name, methods in cands:
+      if methods is None or request.method in methods:
+        return (getattr(controller, name), action)
+    return (None, action)
 
   #----------------------------------------------------------------------------
   def getNextHandler(self, request, controller, remainder):
-    name    = remainder[0]
-    aname   = name
-    if six.PY2 and isinstance(name, unicode):
-      # python2's getattr() seems to require a 'str' attribute name...
-      aname = name.encode('utf-8')
-    handler = getattr(controller, aname, None)
-    handler = self._filterNext(request, controller, remainder, handler)
-    if handler is not None:
-      return handler
-    if '-' in aname:
-      handler = getattr(controller, aname.replace('-', '_'), None)
-      handler = self._filterNext(request, controller, remainder, handler, checkDashUnder=True)
+    meta    = self.getMeta(controller)
+    segment = remainder[0]
+    if meta.dynamic:
+      handler = self._getDynamicHandler(request, controller, meta, segment, segment)
       if handler is not None:
         return handler
-    meta = self.getMeta(controller)
-    for alias in meta.expose.get(name, []):
-      ret = self._filterNext(request, controller, remainder, alias)
-      if ret:
-        return ret
+    for name, methods in meta.table.get(segment, ()):
+      if methods is None or request.method in methods:
+        return getattr(controller, name)
+    if meta.dynamic and '-' in segment:
+      return self._getDynamicHandler(
+        request, controller, meta, segment, segment.replace('-', '_'))
     return None
 
+  #----------------------------------------------------------------------------
+  def _getDynamicHandler(self, request, controller, meta, segment, name):
+    # resolves `segment` against the dynamic (i.e. descriptor-based)
+    # attribute `name`, which can only be classified at request time
+    if name not in meta.dynamic:
+      return None
+    # note: the result of a descriptor can change from request to
+    #       request, so the resolution plan must not be cached
+    ctxt = getattr(request, self.CTXATTR, None)
+    if ctxt is not None:
+      ctxt.dynamic = True
+    handler, methods = self._makeDynamicCandidate(controller, segment, name)
+    if methods is False:
+      return None
+    if methods is None or request.method in methods:
+      return handler
+    return None
+
+  #----------------------------------------------------------------------------
+  def _makeDynamicCandidate(self, controller, segment, name):
+    # returns a tuple of ``(handler, methods)`` for the dynamic
+    # attribute `name` of `controller` (see :meth:`_makeCandidate`)
+    handler = getattr(controller, name, None)
+    specs   = None
+    apc     = getattr(handler, self.PCATTR, None)
+    if isinstance(apc, decorator.MethodDecoration):
+      specs = self._compileSpecs(
+        name, apc, self._getDefaults(_controllerClass(controller)),
+        self.getPackageName(handler))
+    return ( handler, self._makeCandidate(
+      segment, handler, specs, checkDashUnder=( name != segment )) )
+
   #----------------------------------------------------------------------------
   def getLookupHandler(self, request, controller, remainder):
     return self._getOp(request, controller, 'lookup', remainder)[0]
@@ -402,21 +938,38 @@ class Dispatcher(object):
 
   #----------------------------------------------------------------------------
   def dispatch(self, request, controller):
+    pctxt = getattr(request, self.CTXATTR, None)
+    ctxt  = adict(
+      dispatcher=self, root=controller, controller=controller, remainder=None,
+      dynamic=False, plan=None,
+      options=bool(self.autoOptions) and request.method == 'OPTIONS')
+    if self.instrument is not None:
+      ctxt.update(route=[], events=[])
+    if self.traceRate and random.random() < self.traceRate:
+      ctxt.trace = []
+    setattr(request, self.CTXATTR, ctxt)
     try:
-      # normalize the path
       opath = request.matchdict['pyramid_controllers_path']
-      # prefixing with '///' so that leading '..' get dropped (the reason
-      # that a simple '/' prefix is not sufficient is that normpath will not
-      # collapse a leading '//'...)
-      path = os.path.normpath('///' + opath)
-      # normpath strips a trailing '/'... re-append if needed
-      if opath.endswith('/') and not path.endswith('/'):
-        path += '/'
-      # strip leading '/'
-      path = path[1:]
-      # split at '/' and url-decode each component
-      path = [urllib.parse.unquote(e) for e in path.split('/')]
-      ret = self.walk(request, controller, path, [])
+      plan  = None
+      if self.plans is not None:
+        key  = ( controller, request.method, opath )
+        plan = self.plans.get(key)
+        if plan is not None and plan.rest and getMethod(request) != request.method:
+          plan = None
+        if plan is None:
+          ctxt.plan = adict(key=key, fiddlers=[], rest=False)
+      if plan is not None:
+        if ctxt.trace is not None:
+          self._trace(ctxt, 'plan', plan.controller,
+                      target=self._traceName(plan.handler), dectype=plan.dectype)
+        ret = self.execute(request, plan)
+      elif ctxt.events is not None:
+        start = _timer()
+        remainder = self.splitPath(opath)
+        ctxt.events.append(('path', _timer() - start, controller, None))
+        ret = self.walk(request, controller, remainder, [])
+      else:
+        ret = self.walk(request, controller, self.splitPath(opath), [])
       if isinstance(ret, HTTPException) and isinstance(ret, self.raiseType or ()):
         raise ret
       return ret
@@ -424,62 +977,418 @@ class Dispatcher(object):
       if isinstance(exc, self.raiseType or ()):
         raise
       return exc
+    finally:
+      if ctxt.events:
+        self._record(request, ctxt)
+      if pctxt is not None:
+        setattr(request, self.CTXATTR, pctxt)
 
   #----------------------------------------------------------------------------
-  def walk(self, request, controller, remainder, wrappers):
+  def _record(self, request, ctxt):
+    route = '/' + '/'.join(ctxt.route)
+    for phase, elapsed, controller, target in ctxt.events:
+      self.instrument.record(
+        request, phase, elapsed, _controllerClass(controller), route, target)
 
-    # todo: aren't some already-instantiated classes still 'callable'?...
-    if callable(controller):
-      controller = controller(request)
+  #----------------------------------------------------------------------------
+  def execute(self, request, plan):
+    '''
+    Executes a resolution `plan` that was cached by a previous walk
+    (see the `planCacheSize` parameter): runs the plan's fiddlers and
+    then handles the request.
+    '''
+    ctxt = getattr(request, self.CTXATTR)
+    ctxt.controller = plan.controller
+    ctxt.remainder  = plan.remainder
+    if ctxt.route is not None and plan.route is not None:
+      ctxt.route.extend(plan.route)
+    request = self._fiddle(request, ctxt, plan.controller, plan.fiddlers)
+    if getattr(request, self.CTXATTR, None) is not ctxt:
+      setattr(request, self.CTXATTR, ctxt)
+    return self.handle(
+      request, plan.controller, plan.handler, plan.dectype, plan.remainder,
+      plan.wrappers, args=plan.args)
 
-    # do request fiddling
-    fiddlers = self.getFiddlers(request, controller, remainder)
+  #----------------------------------------------------------------------------
+  def compile(self, controller):
+    '''
+    Eagerly compiles the dispatch metadata of `controller` and of all
+    the controllers reachable from it via attributes (including
+    controller classes and controllers that are not exposed, i.e.
+    typical @lookup targets), so that the first request that reaches
+    each of them does not incur the compilation cost. Controllers that
+    are only returned dynamically by @lookup handlers (or that are
+    accessed via descriptors) cannot be discovered. Returns an adict
+    with the following statistics:
+
+    * `controllers`: the number of controllers compiled
+    * `handlers`: the number of handlers indexed
+    * `elapsed`: the time spent, in seconds
+    '''
+    start   = time.time()
+    stats   = adict(controllers=0, handlers=0)
+    seen    = set()
+    metas   = set()
+    pending = [controller]
+    while pending:
+      target = pending.pop()
+      if id(target) in seen:
+        continue
+      seen.add(id(target))
+      if type(target) in (types.TypeType, types.ClassType):
+        meta = self.getClassMeta(target)
+      else:
+        meta = self.getMeta(target)
+      stats.controllers += 1
+      if id(meta) not in metas:
+        metas.add(id(meta))
+        names = set()
+        for dectype in ('fiddle', 'wrap', 'lookup', 'default', 'index'):
+          names.update(meta[dectype])
+        for attrs in meta.expose.values():
+          names.update(attrs)
+        stats.handlers += len(names)
+      for name in dir(target):
+        if name.startswith('__') or name in meta.dynamic:
+          continue
+        attr = getattr(target, name, None)
+        if isinstance(attr, Controller) \
+            or ( type(attr) in (types.TypeType, types.ClassType)
+                 and issubclass(attr, Controller) ):
+          pending.append(attr)
+    stats.elapsed = time.time() - start
+    return stats
+
+  #----------------------------------------------------------------------------
+  def invalidate(self):
+    '''
+    Drops all cached resolution plans, composed @wrap chains and
+    compiled controller class metadata. This must be called if the
+    controller tree is modified at runtime.
+    '''
+    if self.plans is not None:
+      self.plans.clear()
+    self.chains.clear()
+    self.helpers.clear()
+    self.jsonFactories.clear()
+    with self.lock:
+      self.metas.clear()
+
+  #----------------------------------------------------------------------------
+  def splitPath(self, path):
+    '''
+    Returns the tuple of normalized, URL-decoded components of the
+    URL-encoded `path` (see :func:`pyramid_controllers.util.splitPath`),
+    using a bounded LRU cache keyed on `path` (if enabled via the
+    `pathCacheSize` parameter).
+    '''
+    if self.paths is None:
+      return splitPath(path)
+    ret = self.paths.get(path)
+    if ret is None:
+      ret = self.paths.put(path, splitPath(path))
+    return ret
+
+  #----------------------------------------------------------------------------
+  def _fiddle(self, request, ctxt, controller, fiddlers):
+    if ctxt.events is None:
+      for fiddler in fiddlers:
+        request = fiddler(request) or request
+      return request
     for fiddler in fiddlers:
-      request = fiddler(request) or request
-
-    # load wrappers
-    wrappers.extend(self.getWrappers(request, controller, remainder))
-
-    if len(remainder) <= 0 or len(remainder) == 1 and remainder[0] == '':
-      handler = self.getIndexHandler(request, controller, remainder)
-      dectype = 'index'
-      args    = []
-      if handler is None:
-        handler = self.getDefaultHandler(request, controller, remainder)
-        dectype = 'default'
-        args    = [None]
-      if handler is None:
-        raise HTTPNotFound()
-      return self.handle(
-        request, controller, handler, dectype, remainder, wrappers, args=args)
-
-    handler = self.getNextHandler(request, controller, remainder)
-    if isinstance(handler, Controller) \
-          or type(handler) in (types.TypeType, types.ClassType):
-      return self.walk(request, handler, remainder[1:], wrappers)
-    if handler is not None:
-      if len(remainder) > 1:
-        raise HTTPNotFound()
-      return self.handle(
-        request, controller, handler, 'expose', remainder, wrappers)
-
-    lookup = self.getLookupHandler(request, controller, remainder)
-    if lookup is not None:
-      (controller, remainder) = lookup(request, *remainder)
-      return self.walk(request, controller, remainder, wrappers)
-
-    default = self.getDefaultHandler(request, controller, remainder)
-    if default is not None:
-      return self.handle(
-        request, controller, default, 'default', remainder, wrappers, args=remainder)
+      start = _timer()
+      try:
+        request = fiddler(request) or request
+      finally:
+        ctxt.events.append((
+          'fiddle', _timer() - start,
+          getattr(fiddler, '__self__', controller), fiddler))
+    return request
+
+  #----------------------------------------------------------------------------
+  def walk(self, request, controller, remainder, wrappers):
+    '''
+    Walks the controller tree from `controller` along the path
+    components `remainder`, collecting the fiddlers and `wrappers` on
+    the way, and handles the request with the resolved handler. Note
+    that the walk is iterative: each step either advances an index
+    into the current path components (i.e. when descending into an
+    attribute controller), or replaces them with the components
+    returned by a @lookup.
+    '''
+
+    ctxt = getattr(request, self.CTXATTR, None)
+    if ctxt is None:
+      ctxt = adict(dispatcher=self, root=controller, dynamic=False)
+      setattr(request, self.CTXATTR, ctxt)
+    trace    = ctxt.trace
+    segments = remainder
+    pos      = 0
+
+    while True:
+
+      # todo: aren't some already-instantiated classes still 'callable'?...
+      if callable(controller):
+        controller = controller(request)
+        ctxt.dynamic = True
+
+      if pos:
+        remainder = segments[pos:]
+      ctxt.controller = controller
+      ctxt.remainder  = remainder
+      if trace is not None:
+        self._trace(ctxt, 'walk', controller, remainder=list(remainder))
+
+      # note: automatic OPTIONS responses do not invoke any fiddlers
+      #       or wrappers (see `autoOptions`)
+      if not ctxt.options:
+
+        # do request fiddling
+        fiddlers = self.getFiddlers(request, controller, remainder)
+        if trace is not None:
+          for fiddler in fiddlers:
+            self._trace(ctxt, 'fiddle', controller, target=self._traceName(fiddler))
+        request  = self._fiddle(request, ctxt, controller, fiddlers)
+        if getattr(request, self.CTXATTR, None) is not ctxt:
+          setattr(request, self.CTXATTR, ctxt)
+        if ctxt.plan is not None:
+          ctxt.plan.fiddlers.extend(fiddlers)
+
+        # load wrappers
+        wrappers.extend(self.getWrappers(request, controller, remainder))
+
+      count = len(segments) - pos
+      if count <= 0 or count == 1 and segments[pos] == '':
+        handler, spec = self._getIndexOp(request, controller, remainder)
+        dectype = 'index'
+        args    = []
+        if trace is not None:
+          self._trace(ctxt, 'index', controller, target=self._traceName(handler),
+                      accepted=handler is not None,
+                      reason=None if handler is not None else 'no matching @index')
+        if spec is not None and spec.rest:
+          verb, action = self.getVerbHandler(request, controller)
+          if trace is not None:
+            self._trace(ctxt, 'verb', controller, segment=action,
+                        target=self._traceName(verb), accepted=verb is not None,
+                        reason=None if verb is not None else 'no handler for verb')
+          if verb is not None:
+            handler   = verb
+            dectype   = 'expose'
+            remainder = [action]
+            if ctxt.plan is not None:
+              ctxt.plan.rest = True
+        if handler is None:
+          handler = self.getDefaultHandler(request, controller, remainder)
+          dectype = 'default'
+          args    = [None]
+          if trace is not None:
+            self._trace(ctxt, 'default', controller, target=self._traceName(handler),
+                        accepted=handler is not None,
+                        reason=None if handler is not None else 'no matching @default')
+        if handler is None:
+          return self._notFound(request, ctxt, controller, remainder, None,
+                                'no index or default handler')
+        if ctxt.route is not None and remainder and remainder[0] == '':
+          ctxt.route.append('')
+        return self.handle(
+          request, controller, handler, dectype, remainder, wrappers, args=args)
+
+      segment = segments[pos]
+      handler = self.getNextHandler(request, controller, remainder)
+      if trace is not None:
+        self._traceCandidates(request, ctxt, controller, segment, handler)
+      if handler is not None and ctxt.route is not None:
+        ctxt.route.append(segment)
+      if isinstance(handler, Controller) \
+            or type(handler) in (types.TypeType, types.ClassType):
+        controller = handler
+        pos += 1
+        continue
+      if handler is not None:
+        if count > 1:
+          if trace is not None:
+            self._trace(ctxt, 'notfound', controller, segment=segments[pos + 1],
+                        reason='extra path components after handler')
+          raise HTTPNotFound()
+        return self.handle(
+          request, controller, handler, 'expose', remainder, wrappers)
+
+      lookup, spec = self._getOp(request, controller, 'lookup', remainder)
+      if trace is not None and lookup is not None:
+        self._trace(ctxt, 'lookup', controller, segment=segment,
+                    target=self._traceName(lookup), accepted=True)
+      if lookup is not None:
+        call = lookup
+        if spec.cache:
+          call = functools.partial(spec.cache, controller, lookup, spec.arity)
+        if ctxt.events is None:
+          (controller, rem) = call(request, *remainder)
+        else:
+          start = _timer()
+          try:
+            (target, rem) = call(request, *remainder)
+          finally:
+            ctxt.events.append(('lookup', _timer() - start, controller, lookup))
+          controller = target
+        if ctxt.route is not None:
+          ctxt.route.extend(['{' + self.NAME_LOOKUP + '}'] * (count - len(rem)))
+        ctxt.dynamic = True
+        segments  = rem
+        remainder = rem
+        pos       = 0
+        continue
+
+      default = self.getDefaultHandler(request, controller, remainder)
+      if trace is not None:
+        self._trace(ctxt, 'default', controller, segment=segment,
+                    target=self._traceName(default), accepted=default is not None,
+                    reason=None if default is not None else 'no matching @default')
+      if default is not None:
+        if ctxt.route is not None:
+          ctxt.route.append(self.NAME_DEFAULT)
+        return self.handle(
+          request, controller, default, 'default', remainder, wrappers, args=remainder)
 
+      return self._notFound(request, ctxt, controller, remainder, segment,
+                            'no handler, @lookup or @default')
+
+  #----------------------------------------------------------------------------
+  def _notFound(self, request, ctxt, controller, remainder, segment, reason):
+    # terminates a walk that did not find a handler for `request`: if
+    # the resource exists, but does not accept the request's method,
+    # this responds with a 405 (or the automatic OPTIONS response),
+    # otherwise with a 404.
+    allowed = self.getAllowedMethods(controller, remainder)
+    if ctxt.options and allowed:
+      return self.makeOptionsResponse(request, allowed)
+    if ctxt.trace is not None:
+      kw = dict(segment=segment) if segment is not None else dict()
+      if allowed:
+        self._trace(ctxt, 'notallowed', controller, reason='method not allowed', **kw)
+      else:
+        self._trace(ctxt, 'notfound', controller, reason=reason, **kw)
+    if allowed:
+      raise HTTPMethodNotAllowed(headers=[('Allow', self.formatAllow(allowed))])
     raise HTTPNotFound()
 
+  #----------------------------------------------------------------------------
+  def getAllowedMethods(self, controller, remainder):
+    '''
+    Returns the frozenset of HTTP methods that `controller` accepts
+    for the path components `remainder` that it is responsible for,
+    i.e. either an index request (an empty `remainder` or a trailing
+    slash), or a request for the exposed handlers of the first
+    component. The set is taken from the compiled metadata (see
+    :meth:`makeMeta`) and therefore does not account for handlers
+    provided by descriptors or for @lookup handlers. An empty set
+    indicates that the resource does not exist.
+    '''
+    allowed = self.getMeta(controller).allowed
+    if not remainder or ( len(remainder) == 1 and remainder[0] in ('', None) ):
+      return allowed.index
+    if len(remainder) > 1:
+      return allowed.default
+    return allowed.segments.get(remainder[0], allowed.default)
+
+  #----------------------------------------------------------------------------
+  def formatAllow(self, allowed):
+    '''
+    Returns the value of an ``Allow`` header for the set of HTTP
+    methods `allowed` (which includes ``OPTIONS`` if `autoOptions` is
+    enabled).
+    '''
+    if self.autoOptions:
+      allowed = allowed | frozenset(['OPTIONS'])
+    return ', '.join(sorted(allowed))
+
+  #----------------------------------------------------------------------------
+  def makeOptionsResponse(self, request, allowed):
+    '''
+    Returns the response to an ``OPTIONS`` request (if `autoOptions`
+    is enabled) for a resource that accepts the HTTP methods `allowed`
+    (a frozenset). The default implementation returns an empty
+    ``200 OK`` response with an ``Allow`` header and, for CORS
+    preflight requests (i.e. requests with an ``Origin`` and an
+    ``Access-Control-Request-Method`` header), the
+    ``Access-Control-Allow-Methods`` and ``Access-Control-Allow-Headers``
+    (mirroring the requested headers) headers. Note that it does *not*
+    set ``Access-Control-Allow-Origin``, since that is an application
+    policy: subclasses can override this method to do so, e.g.::
+
+      class CorsDispatcher(Dispatcher):
+        def makeOptionsResponse(self, request, allowed):
+          response = super(CorsDispatcher, self).makeOptionsResponse(request, allowed)
+          if request.headers.get('Origin') in TRUSTED_ORIGINS:
+            response.headers['Access-Control-Allow-Origin'] = request.headers['Origin']
+          return response
+    '''
+    allow    = self.formatAllow(allowed)
+    response = Response(status=200, headerlist=[
+      ('Allow', allow), ('Content-Length', '0')])
+    if 'Origin' in request.headers \
+        and 'Access-Control-Request-Method' in request.headers:
+      response.headers['Access-Control-Allow-Methods'] = allow
+      if request.headers.get('Access-Control-Request-Headers'):
+        response.headers['Access-Control-Allow-Headers'] = \
+          request.headers['Access-Control-Request-Headers']
+    return response
+
+  #----------------------------------------------------------------------------
+  def _trace(self, ctxt, event, controller, **kw):
+    kw.update(event=event, controller=_controllerClass(controller).__name__)
+    ctxt.trace.append(adict(kw))
+
+  #----------------------------------------------------------------------------
+  def _traceName(self, handler):
+    if handler is None:
+      return None
+    return getattr(handler, '__name__', None) or _controllerClass(handler).__name__
+
+  #----------------------------------------------------------------------------
+  def _traceCandidates(self, request, ctxt, controller, segment, handler):
+    # records the candidates for `segment`, i.e. replays the decisions
+    # made by :meth:`getNextHandler`, for traced requests only
+    meta  = self.getMeta(controller)
+    cands = []
+    if segment in meta.dynamic:
+      cands.append((segment, self._makeDynamicCandidate(controller, segment, segment)[1]))
+    cands.extend(meta.table.get(segment, ()))
+    name = segment.replace('-', '_')
+    if name != segment and name in meta.dynamic:
+      cands.append((name, self._makeDynamicCandidate(controller, segment, name)[1]))
+    if not cands:
+      self._trace(ctxt, 'candidate', controller, segment=segment, target=None,
+                  accepted=False, reason='no such handler or controller')
+    # note: the accepted candidate is the first acceptable one (which
+    #       avoids comparing to the results of descriptors, which may
+    #       differ per evaluation)
+    selected = handler is None
+    for name, methods in cands:
+      accepted = not selected and methods is not False \
+        and ( methods is None or request.method in methods )
+      if accepted:
+        selected = True
+        reason = None
+      elif methods is False:
+        reason = 'not exposed'
+      elif methods is not None and request.method not in methods:
+        reason = 'method %s not in %s' % (request.method, ', '.join(sorted(methods)))
+      else:
+        reason = 'shadowed by a preceding candidate'
+      self._trace(ctxt, 'candidate', controller, segment=segment, target=name,
+                  accepted=accepted, reason=reason)
+
   #----------------------------------------------------------------------------
   def handle(self, request, controller, handler, dectype, remainder, wrappers, args=None):
     if handler is None or not callable(handler):
       raise HTTPNotFound()
 
+    ctxt = getattr(request, self.CTXATTR, None)
+    if ctxt is not None and ctxt.options:
+      return self.makeOptionsResponse(
+        request, self.getAllowedMethods(controller, ctxt.remainder))
+
     # TODO: resolve parameters...
     params = dict()
 
@@ -488,14 +1397,225 @@ class Dispatcher(object):
 
     # todo: should `args` and `params` be passed to the wrappers as well?...
     # todo: should i trap exceptions to allow @expose matching?...
-    def recursive_handle(request):
-      if wrappers:
-        return wrappers.pop(0)(request, recursive_handle)
-      return handler(request, *args, **params)
+    cache = not args and not params and ctxt is not None and not ctxt.dynamic
+
+    if cache and ctxt.plan is not None and dectype != 'default':
+      plan = ctxt.plan
+      ctxt.plan = None
+      if not plan.rest or getMethod(request) == request.method:
+        self.plans.put(plan.pop('key'), plan.update(
+          fiddlers=tuple(plan.fiddlers), controller=controller,
+          handler=handler, dectype=dectype, remainder=remainder,
+          wrappers=tuple(wrappers), args=args,
+          route=tuple(ctxt.route) if ctxt.route is not None else None))
+
+    # note: conditional requests and the response cache are handled
+    #       by the innermost step of the @wrap chain (i.e. after all
+    #       wrappers, which may, e.g., enforce access control, have run)
+    spec = None
+    if request.method in ('GET', 'HEAD'):
+      spec = self._getHandleSpec(request, controller, handler, dectype, remainder)
 
-    response = recursive_handle(request)
+    if ctxt is not None and ctxt.events is not None:
+      return self._handleTimed(
+        request, ctxt.events, controller, handler, dectype, remainder,
+        wrappers, args, params, spec)
+
+    if spec is not None:
+      chain = self.getChain(
+        functools.partial(
+          self._handleCached, spec, controller, handler, dectype, remainder, handler),
+        wrappers, args, params)
+    else:
+      chain = self.getChain(handler, wrappers, args, params, cache=cache)
+    response = chain(request)
     return self.render(request, response, controller, handler, dectype, remainder)
 
+  #----------------------------------------------------------------------------
+  def _handleCached(self, spec, controller, handler, dectype, remainder, call,
+                    request, *args, **params):
+    # the innermost step of the @wrap chain of handlers that declare
+    # conditional request validators or a response cache: it answers
+    # 304s and cache hits, or else invokes `handler` (via `call`),
+    # renders and caches the result. Note that the wrappers of such
+    # handlers therefore always receive a Response.
+    ctxt       = getattr(request, self.CTXATTR, None)
+    trace      = ctxt is not None and ctxt.trace is not None
+    validators = None
+    if spec.etag or spec.lastModified:
+      validators = self.getValidators(request, controller, spec)
+      modified   = self._isModified(request, *validators)
+      if trace:
+        self._trace(ctxt, 'conditional', controller, target=self._traceName(handler),
+                    accepted=not modified,
+                    reason='modified' if modified else None)
+      if not modified:
+        return self._setValidators(HTTPNotModified(), *validators)
+    if spec.cache:
+      key   = self.getCacheKey(request, spec.cache)
+      entry = self.responseCache.get(key)
+      if trace:
+        self._trace(ctxt, 'cache', controller, target=self._traceName(handler),
+                    accepted=entry is not None,
+                    reason=None if entry is not None else 'response cache miss')
+      if entry is not None:
+        response = Response(status=entry[0], headerlist=list(entry[1]), body=entry[2])
+        if validators is not None:
+          self._setValidators(response, *validators)
+        return response
+    response = call(request, *args, **params)
+    response = self.render(request, response, controller, handler, dectype, remainder)
+    if validators is not None and isinstance(response, Response) \
+        and response.status_int == 200:
+      self._setValidators(response, *validators)
+    if spec.cache and not ( self.fastHead and request.method == 'HEAD' ):
+      self._storeResponse(key, spec.cache, response)
+    return response
+
+  #----------------------------------------------------------------------------
+  def _getHandleSpec(self, request, controller, handler, dectype, remainder):
+    # returns the spec of `handler` that applies to `request` if it
+    # declares a response cache or conditional request validators,
+    # otherwise ``None``
+    specs = self.getSpecs(controller, handler)
+    if not specs or not ( specs.cache or specs.validate ):
+      return None
+    spec = self._select(request, None, controller, handler, dectype,
+                        remainder, specs[dectype])
+    if spec is None or not ( spec.cache or spec.etag or spec.lastModified ):
+      return None
+    return spec
+
+  #----------------------------------------------------------------------------
+  def getValidators(self, request, controller, spec):
+    '''
+    Evaluates the `etag` and `lastModified` validators declared by the
+    handler `spec` for `request` and returns a tuple of ``(etag,
+    lastModified)``, where each is ``None`` if not declared (or if the
+    validator returned ``None``). A validator is either a callable
+    that is called with `request`, or the name of a method of
+    `controller` that is called with `request`. The last-modified
+    time is normalized to a timezone-aware datetime with a resolution
+    of one second.
+    '''
+    etag     = self._callValidator(request, controller, spec.etag)
+    modified = self._callValidator(request, controller, spec.lastModified)
+    if etag is not None:
+      etag = str(etag)
+    if modified is not None:
+      modified = parse_date(serialize_date(modified))
+    return ( etag, modified )
+
+  #----------------------------------------------------------------------------
+  def _callValidator(self, request, controller, validator):
+    # calls `validator`, a callable or the name of a method of
+    # `controller`, with `request`
+    if validator is None:
+      return None
+    if isstr(validator):
+      validator = getattr(controller, validator)
+    return validator(request)
+
+  #----------------------------------------------------------------------------
+  def _isModified(self, request, etag, modified):
+    # evaluates the request's conditional headers (If-None-Match takes
+    # precedence over If-Modified-Since, as per RFC 7232)
+    if 'If-None-Match' in request.headers:
+      return etag is None or etag not in request.if_none_match
+    since = request.if_modified_since
+    if modified is None or since is None:
+      return True
+    return modified > since
+
+  #----------------------------------------------------------------------------
+  def _setValidators(self, response, etag, modified):
+    if etag is not None:
+      response.etag = etag
+    if modified is not None:
+      response.last_modified = modified
+    return response
+
+  #----------------------------------------------------------------------------
+  def getCacheKey(self, request, cache):
+    '''
+    Returns the response cache key of `request` for the handler cache
+    declaration `cache` (an adict with the attributes `ttl` and
+    `vary`). The key is built from the request URL (i.e. the resolved
+    route, including the query string), the request method (where
+    ``HEAD`` shares the ``GET`` entry) and the values of the request
+    headers listed in `cache.vary`.
+    '''
+    method = 'GET' if request.method == 'HEAD' else request.method
+    return '\n'.join(
+      [method, request.url]
+      + [name + ':' + request.headers.get(name, '') for name in cache.vary])
+
+  #----------------------------------------------------------------------------
+  def _storeResponse(self, key, cache, response):
+    # only complete, successful and non-personalized responses are stored
+    if not isinstance(response, Response) \
+        or response.status_int != 200 \
+        or 'Set-Cookie' in response.headers \
+        or response.cache_control.no_store \
+        or response.cache_control.private is not None \
+        or not isinstance(response.app_iter, (list, tuple)):
+      return
+    self.responseCache.put(
+      key, ( response.status, tuple(response.headerlist), response.body ), cache.ttl)
+
+  #----------------------------------------------------------------------------
+  def _handleTimed(self, request, events, controller, handler, dectype,
+                   remainder, wrappers, args, params, spec=None):
+    # the instrumented version of the tail end of :meth:`handle`, which
+    # times the wrapper chain, the handler and the rendering (note that
+    # the rendering of handlers with a `spec`, see :meth:`_handleCached`,
+    # is timed as part of the wrapper chain)
+    call = functools.partial(_timeHandler, events, controller, handler)
+    if spec is not None:
+      call = functools.partial(
+        self._handleCached, spec, controller, handler, dectype, remainder, call)
+    chain = self.getChain(call, wrappers, args, params)
+    count = len(events)
+    start = _timer()
+    try:
+      response = chain(request)
+    finally:
+      if wrappers:
+        elapsed = _timer() - start - sum(
+          event[1] for event in events[count:] if event[0] == 'handler')
+        events.append(('wrap', elapsed, controller, None))
+    start = _timer()
+    try:
+      return self.render(request, response, controller, handler, dectype, remainder)
+    finally:
+      events.append(('render', _timer() - start, controller, handler))
+
+  #----------------------------------------------------------------------------
+  def getChain(self, handler, wrappers, args=None, params=None, cache=False):
+    '''
+    Returns a callable that takes a single `request` parameter and
+    invokes `handler` (with the additional `args` and `params`)
+    wrapped by `wrappers`, where the first wrapper is the outermost.
+    If `cache` is truthy, the composed chain is cached and re-used for
+    subsequent calls with the same wrappers and handler.
+    '''
+    key = None
+    if cache and self.chainCacheSize:
+      key = ( handler, ) + tuple(wrappers)
+      chain = self.chains.get(key)
+      if chain is not None:
+        return chain
+    chain = handler
+    if args or params:
+      chain = functools.partial(_callHandler, handler, args or (), params or {})
+    for wrapper in reversed(wrappers):
+      chain = functools.partial(_callWrapper, wrapper, chain)
+    if key is not None:
+      if len(self.chains) >= self.chainCacheSize:
+        self.chains.clear()
+      self.chains[key] = chain
+    return chain
+
   #----------------------------------------------------------------------------
   def getPackageName(self, handler):
     try:
@@ -513,22 +1633,163 @@ class Dispatcher(object):
     if isinstance(response, six.string_types):
       request.response.body = response
       return request.response
-    package  = self.getPackageName(handler)
     renderer = getattr(request, 'override_renderer', None)
     if renderer is not None:
-      return render_to_response(renderer, response, request, package)
+      return render_to_response(
+        renderer, response, request, self.getPackageName(handler))
     # NOTE: this is a *horrible* hack... see restcontroller.py why it
     #       is needed.
     handler, dectype, remainder = \
       getattr(request, '_restcontroller_snaghack', ( handler, dectype, remainder ))
-    pc   = getattr(handler, self.PCATTR, adict())
-    spec = self._select(request, response, controller, handler, dectype,
-                        remainder, getattr(pc, dectype, []))
+    specs = self.getSpecs(controller, handler)
+    spec  = self._select(request, response, controller, handler, dectype,
+                         remainder, specs[dectype] if specs else ())
     if spec is None:
+      if isStream(response):
+        # note: iterators returned by handlers without a renderer are
+        #       streamed as-is (see `pyramid_controllers.stream`)
+        request.response.app_iter = iterChunks(
+          response, encoding=request.response.charset or 'utf-8')
+        return request.response
       raise ControllerError(
         'no renderer found for handler "%r", request "%r", and response "%r"'
         % (handler, request, response))
-    return render_to_response(spec.renderer, response, request, package)
+    if self.fastHead and request.method == 'HEAD' and not spec.head:
+      head = self._renderHead(request, controller, spec)
+      if head is not None:
+        return head
+    if self.fastJson and spec.renderer == 'json':
+      factory = self.getJsonFactory(request)
+      if factory is not None:
+        return self._renderJson(request, response, factory)
+    helper = self.getRendererHelper(request, spec)
+    # note: this replicates `pyramid.renderers.render_to_response`
+    if hide_attrs is None:
+      return helper.render_to_response(response, None, request=request)
+    with hide_attrs(request, 'response'):
+      return helper.render_to_response(response, None, request=request)
+
+  #----------------------------------------------------------------------------
+  def getRendererHelper(self, request, spec):
+    '''
+    Returns the pyramid RendererHelper for the handler specification
+    `spec` in the registry of `request`. Helpers (and therefore the
+    renderers that they instantiate on first use) are created once
+    per renderer name, package and registry and then re-used.
+    '''
+    registry = getattr(request, 'registry', None)
+    if registry is None:
+      registry = get_current_registry()
+    # note: pyramid registries are not hashable (they are dicts)
+    key   = ( spec.renderer, spec.package, id(registry) )
+    entry = self.helpers.get(key)
+    if entry is not None and entry[0] is registry:
+      return entry[1]
+    helper = RendererHelper(name=spec.renderer, package=spec.package, registry=registry)
+    if len(self.helpers) >= 1024:
+      self.helpers.clear()
+    self.helpers[key] = ( registry, helper )
+    return helper
+
+  #----------------------------------------------------------------------------
+  def getJsonFactory(self, request):
+    '''
+    Returns the :class:`pyramid.renderers.JSON` renderer factory that
+    is registered as the ``json`` renderer in the registry of
+    `request` if it is eligible for the `fastJson` rendering path,
+    otherwise ``None``.
+    '''
+    registry = getattr(request, 'registry', None)
+    if registry is None:
+      registry = get_current_registry()
+    entry = self.jsonFactories.get(id(registry))
+    if entry is None or entry[0] is not registry:
+      factory = registry.queryUtility(IRendererFactory, name='json')
+      if type(factory) is not JSON:
+        factory = None
+      if len(self.jsonFactories) >= 64:
+        self.jsonFactories.clear()
+      entry = self.jsonFactories[id(registry)] = ( registry, factory )
+    # note: subscribers may be registered at any time, so this is not
+    #       cached with the factory
+    if entry[1] is None or self._hasRenderListeners(registry):
+      return None
+    return entry[1]
+
+  #----------------------------------------------------------------------------
+  def _hasRenderListeners(self, registry):
+    # returns truthy if `registry` has subscribers that would receive
+    # the `BeforeRender` events that the generic renderer machinery
+    # emits (i.e. to the class, IBeforeRender or any of its bases)
+    if not getattr(registry, 'has_listeners', True):
+      return False
+    adapters = getattr(registry, 'adapters', None)
+    if adapters is None:
+      return True
+    return bool(adapters.subscriptions([implementedBy(BeforeRender)], None))
+
+  #----------------------------------------------------------------------------
+  def _renderJson(self, request, value, factory):
+    # the `fastJson` version of :meth:`render`, which replicates the
+    # `pyramid.renderers.JSON` renderer without the generic machinery
+    # (including the response handling of `render_to_response`)
+    if hide_attrs is None:
+      return self._serializeJson(request, value, factory)
+    with hide_attrs(request, 'response'):
+      return self._serializeJson(request, value, factory)
+
+  #----------------------------------------------------------------------------
+  def _serializeJson(self, request, value, factory):
+    response = request.response
+    if response.content_type == response.default_content_type:
+      response.content_type = 'application/json'
+    default = makeJsonDefault(factory, request)
+    if callable(self.fastJson):
+      result = self.fastJson(value, default=default)
+    else:
+      result = factory.serializer(value, default=default, **factory.kw)
+    if isinstance(result, six.text_type):
+      response.text = result
+    else:
+      response.body = result
+    return response
+
+  #----------------------------------------------------------------------------
+  def _renderHead(self, request, controller, spec):
+    # the `fastHead` version of :meth:`render`, which skips rendering
+    # the body (see the `fastHead` parameter). Returns ``None`` if the
+    # content type that the renderer would set is not known, in which
+    # case the result must be rendered normally.
+    contentType = self._getRendererContentType(request, spec)
+    if contentType is None:
+      return None
+    # note: this replicates the response handling of
+    #       `pyramid.renderers.render_to_response`
+    if hide_attrs is None:
+      response = request.response
+    else:
+      with hide_attrs(request, 'response'):
+        response = request.response
+    if response.content_type == response.default_content_type:
+      response.content_type = contentType
+    response.content_length = self._callValidator(
+      request, controller, spec.contentLength)
+    return response
+
+  #----------------------------------------------------------------------------
+  def _getRendererContentType(self, request, spec):
+    # returns the content type that the renderer of `spec` sets on
+    # the response (if it is one that is known to do so independently
+    # of the rendered value), otherwise ``None``
+    helper  = self.getRendererHelper(request, spec)
+    factory = helper.registry.queryUtility(IRendererFactory, name=helper.type)
+    if type(factory) is JSON:
+      return 'application/json'
+    if isinstance(factory, NDJSON):
+      return factory.contentType
+    if factory is string_renderer_factory:
+      return 'text/plain'
+    return None
 
 
 #------------------------------------------------------------------------------
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+#------------------------------------------------------------------------------
+# file: $Id$
+# lib:  pyramid_controllers.instrument
+# date: 2026/10/17
+# copy: (C) Copyright 2026 Cadit Inc., see LICENSE.txt
+#------------------------------------------------------------------------------
+
+'''
+``pyramid_controllers.instrument`` provides the interface for
+receiving per-phase dispatch timing events from a
+:class:`pyramid_controllers.Dispatcher` (see its `instrument`
+parameter), and a simple aggregating implementation.
+'''
+
+import threading
+
+from .util import adict
+
+__all__ = ('Instrument', 'PhaseTimer')
+
+#------------------------------------------------------------------------------
+class Instrument(object):
+  '''
+  The base class of dispatch instrumentation sinks. When a request
+  has been dispatched, the dispatcher calls :meth:`record` once for
+  each timed phase, in the order that the phases completed.
+  '''
+
+  #: path normalization (see :meth:`Dispatcher.splitPath`)
+  PATH    = 'path'
+  #: a single @fiddle handler
+  FIDDLE  = 'fiddle'
+  #: a single @lookup handler
+  LOOKUP  = 'lookup'
+  #: the @wrap chain, excluding the time spent in the handler
+  WRAP    = 'wrap'
+  #: the handler body
+  HANDLER = 'handler'
+  #: rendering of the handler's result
+  RENDER  = 'render'
+
+  #----------------------------------------------------------------------------
+  def record(self, request, phase, elapsed, controller, route, target):
+    '''
+    Records a single timing event. The parameters are:
+
+    :Parameters:
+
+    request : pyramid.request.Request
+
+      The request that was dispatched.
+
+    phase : str
+
+      The dispatch phase, one of the phase constants of this class,
+      e.g. ``Instrument.FIDDLE``.
+
+    elapsed : float
+
+      The time spent in the phase, in seconds.
+
+    controller : class
+
+      The class of the controller that the phase was executed for.
+
+    route : str
+
+      The resolved route pattern, relative to the controller mount
+      point, e.g. ``'/users/{...}/profile'``. Path components consumed
+      by a @lookup are represented by ``{...}`` and components passed
+      to a @default handler by ``*``.
+
+    target : callable
+
+      The fiddler, lookup or handler that the phase timed (``None``
+      for `path` and `wrap` events).
+    '''
+    pass
+
+#------------------------------------------------------------------------------
+class PhaseTimer(Instrument):
+  '''
+  A thread-safe :class:`Instrument` that aggregates the count, total
+  and maximum elapsed time per phase, route, controller class and
+  target. The aggregates are available via :meth:`stats`.
+  '''
+
+  #----------------------------------------------------------------------------
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.data = dict()
+
+  #----------------------------------------------------------------------------
+  def record(self, request, phase, elapsed, controller, route, target):
+    key = ( phase, route, controller, getattr(target, '__name__', None) )
+    with self.lock:
+      stat = self.data.get(key)
+      if stat is None:
+        stat = self.data[key] = adict(count=0, total=0.0, max=0.0)
+      stat.count += 1
+      stat.total += elapsed
+      if elapsed > stat.max:
+        stat.max = elapsed
+
+  #----------------------------------------------------------------------------
+  def stats(self):
+    '''
+    Returns a list of adicts, one per unique combination of phase,
+    route, controller class and target name, with the attributes
+    `phase`, `route`, `controller`, `target`, `count`, `total` and
+    `max`, sorted by decreasing `total`.
+    '''
+    with self.lock:
+      items = list(self.data.items())
+    ret = [
+      adict(phase=key[0], route=key[1], controller=key[2], target=key[3]).update(stat)
+      for key, stat in items]
+    return sorted(ret, key=lambda stat: -stat.total)
+
+  #----------------------------------------------------------------------------
+  def clear(self):
+    with self.lock:
+      self.data.clear()
+
+#------------------------------------------------------------------------------
+# end of $Id$
+#------------------------------------------------------------------------------
@@ -12,12 +12,119 @@
 integrating the controller-based request dispatch mechanism.
 '''
 
+import logging
+
+from pyramid.settings import asbool
+from pyramid.exceptions import ConfigurationError
+
 from .dispatcher import Dispatcher
+from .stream import NDJSON, JSONArray
+from .util import adict
+
+log = logging.getLogger(__name__)
+
+#: the name of the pyramid route shared by all `shared` controller mounts
+SHARED_ROUTE = 'pyramid_controllers'
+
+#------------------------------------------------------------------------------
+class MountTable(object):
+  '''
+  A prefix trie of controller mount points, keyed by path segment, so
+  that finding the mount point of a request path is proportional to
+  the depth of the path, and not to the number of mount points.
+  '''
+
+  #----------------------------------------------------------------------------
+  def __init__(self):
+    self.root = adict(children=dict(), mount=None)
+
+  #----------------------------------------------------------------------------
+  def add(self, pattern, mount):
+    '''
+    Adds `mount` at the static URL path `pattern` (which must not have
+    a trailing slash, e.g. ``''`` or ``'/foo/bar'``).
+    '''
+    node = self.root
+    for segment in pattern.split('/')[1:]:
+      child = node.children.get(segment)
+      if child is None:
+        child = node.children[segment] = adict(children=dict(), mount=None)
+      node = child
+    if node.mount is not None:
+      raise ConfigurationError(
+        'controllers %r and %r are both mounted at %r'
+        % (node.mount.name, mount.name, pattern or '/'))
+    node.mount = mount
+
+  #----------------------------------------------------------------------------
+  def match(self, path):
+    '''
+    Returns a tuple of ``(mount, remainder)`` for the longest mount
+    point that is a prefix of `path` (at a path segment boundary),
+    where `remainder` is the rest of `path`. If there is no such mount
+    point, returns ``(None, None)``.
+    '''
+    node  = self.root
+    found = ( node.mount, 0 ) if node.mount is not None else None
+    pos   = 0
+    while pos < len(path):
+      end = path.find('/', pos + 1)
+      if end < 0:
+        end = len(path)
+      node = node.children.get(path[pos + 1:end])
+      if node is None:
+        break
+      pos = end
+      if node.mount is not None:
+        found = ( node.mount, pos )
+    if found is None:
+      return ( None, None )
+    return ( found[0], path[found[1]:] )
+
+#------------------------------------------------------------------------------
+class MountPredicate(object):
+  '''
+  The pyramid route predicate of the route shared by all `shared`
+  controller mounts: it matches if the request path is within a mount
+  point and, if so, stores the mount and the controller-relative path
+  in the route's matchdict.
+  '''
+  def __init__(self, val, config):
+    self.val    = val
+    self.mounts = getMountTable(config.registry)
+  def text(self):
+    return 'pyramid_controllers_mount = %r' % (self.val,)
+  phash = text
+  def __call__(self, info, request):
+    mount, path = self.mounts.match('/' + info['match']['pyramid_controllers_path'])
+    if mount is None:
+      return False
+    info['match']['pyramid_controllers_mount'] = mount
+    info['match']['pyramid_controllers_path']  = path or '/'
+    return True
+
+#------------------------------------------------------------------------------
+def getMountTable(registry):
+  '''
+  Returns the :class:`MountTable` of the `shared` controller mounts of
+  the pyramid `registry`, creating it if needed.
+  '''
+  mounts = getattr(registry, 'pyramid_controllers_mounts', None)
+  if mounts is None:
+    mounts = registry.pyramid_controllers_mounts = MountTable()
+  return mounts
+
+#------------------------------------------------------------------------------
+def handleMountRequest(request):
+  mount = request.matchdict.pop('pyramid_controllers_mount')
+  return mount.dispatcher.dispatch(request, mount.controller)
 
 #------------------------------------------------------------------------------
 def add_controller(self,
                    route_name, pattern, controller,
                    dispatcher=None,
+                   eager=None,
+                   shared=None,
                    **kw):
   '''
 
@@ -48,6 +155,29 @@ def add_controller(self,
     be used (with all default options, including `defaultForceSlash`
     enabled).
 
+  :param eager:
+
+    [optional] If truthy, the entire controller tree is walked and all
+    dispatch metadata is compiled at configuration time (see
+    :meth:`pyramid_controllers.Dispatcher.compile`) instead of lazily
+    on the first request that reaches each controller, and a report is
+    logged. If not specified, defaults to the value of the
+    ``pyramid_controllers.eager`` setting, which defaults to false.
+
+  :param shared:
+
+    [optional] If truthy, instead of registering two pyramid routes for
+    this controller, it is added to a prefix trie of mount points that
+    is shared by all `shared` controllers and that is served by a
+    single pyramid route (named ``pyramid_controllers``), so that the
+    cost of finding the controller does not grow with the number of
+    mounted controllers. The `pattern` must then be a static path
+    (i.e. without any ``{...}`` replacement markers) and no additional
+    route parameters are supported. Note that `route_name` is then not
+    registered as a pyramid route. If not specified, defaults to the
+    value of the ``pyramid_controllers.shared`` setting, which defaults
+    to false.
+
   Any additional keyword parameters will be passed through to the
   `config.add_route()` call.
 
@@ -70,6 +200,35 @@ def add_controller(self,
   # TODO: add permission walking...
 
   dispatcher = dispatcher or Dispatcher()
+  settings   = self.registry.settings or {}
+
+  if shared is None:
+    shared = settings.get('pyramid_controllers.shared')
+  if asbool(shared) and ( '{' in pattern or kw ):
+    raise ConfigurationError(
+      'shared controller mount %r must have a static pattern and no route'
+      ' parameters (pattern: %r, parameters: %r)'
+      % (route_name, pattern, sorted(kw.keys())))
+
+  if eager is None:
+    eager = settings.get('pyramid_controllers.eager')
+  if asbool(eager):
+    stats = dispatcher.compile(controller)
+    log.info(
+      'route %r: compiled %d controllers (%d handlers) in %.3f ms',
+      route_name, stats.controllers, stats.handlers, stats.elapsed * 1000)
+
+  if asbool(shared):
+    mounts = getattr(self.registry, 'pyramid_controllers_mounts', None)
+    if mounts is None:
+      mounts = getMountTable(self.registry)
+      self.add_route(
+        SHARED_ROUTE, pattern='/{pyramid_controllers_path:.*$}',
+        pyramid_controllers_mount=True)
+      self.add_view(view=handleMountRequest, route_name=SHARED_ROUTE)
+    mounts.add(pattern, adict(
+      name=route_name, controller=controller, dispatcher=dispatcher))
+    return
 
   # pyramid's routing fails to match subdirectories if the controller
   # is anchored at "/", thus building a workaround... otherwise i would
@@ -98,6 +257,9 @@ def add_controller(self,
 #------------------------------------------------------------------------------
 def includeme(config):
   config.add_directive('add_controller', add_controller)
+  config.add_route_predicate('pyramid_controllers_mount', MountPredicate)
+  config.add_renderer('ndjson', NDJSON())
+  config.add_renderer('jsonstream', JSONArray())
 
 #------------------------------------------------------------------------------
 # end of $Id$
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+#------------------------------------------------------------------------------
+# file: $Id$
+# lib:  pyramid_controllers.loadtest
+# date: 2026/10/17
+# copy: (C) Copyright 2026 Cadit Inc., see LICENSE.txt
+#------------------------------------------------------------------------------
+
+'''
+``pyramid_controllers.loadtest`` is an in-process, end-to-end load
+harness. Unlike :mod:`pyramid_controllers.benchmark`, which times the
+Dispatcher in isolation, it builds a complete pyramid application via
+``config.add_controller()`` (with a RestController, a @lookup, @expose
+extension aliases and the JSON renderer) and drives it through the
+WSGI interface from a pool of threads, thus measuring the combined
+cost of pyramid's routing, the controller views and the dispatcher.
+It runs fully offline, for example::
+
+  $ python -m pyramid_controllers.loadtest --threads 4 --requests 20000
+
+and reports the throughput, the p50/p95/p99 latencies and the
+per-request allocations as JSON. Allocations are measured with
+``tracemalloc`` where available; otherwise (i.e. on python 2) the
+number of garbage-collector tracked objects created per request is
+reported instead.
+'''
+
+import sys
+import gc
+import json
+import platform
+import argparse
+import threading
+import timeit
+
+from six import BytesIO
+from webob import Request
+from pyramid.config import Configurator
+
+from .controller import Controller
+from .restcontroller import RestController
+from .decorator import expose, lookup
+from .dispatcher import Dispatcher
+from .util import adict, getVersion
+
+try:
+  import tracemalloc
+except ImportError:
+  tracemalloc = None
+
+#------------------------------------------------------------------------------
+class ItemController(RestController):
+  @expose(renderer='json')
+  def get(self, request):
+    return dict(id=request.item_id, name='item-' + request.item_id)
+  @expose(renderer='json')
+  def put(self, request):
+    return dict(id=request.item_id, updated=True, size=len(request.body))
+
+#------------------------------------------------------------------------------
+class ItemsController(Controller):
+  ITEM = ItemController(expose=False)
+  @expose(renderer='json')
+  def list(self, request):
+    return dict(items=[dict(id=str(idx)) for idx in range(10)])
+  @lookup
+  def _lookup(self, request, item_id, *rem):
+    request.item_id = item_id
+    return (self.ITEM, rem)
+
+#------------------------------------------------------------------------------
+class RootController(Controller):
+  items = ItemsController()
+  @expose(name='status', ext=(None, 'json'), renderer='json')
+  def status(self, request):
+    return dict(status='ok')
+
+#------------------------------------------------------------------------------
+#: the default request mix, as a list of ``(weight, method, path, body)``
+DEFAULT_MIX = (
+  (4, 'GET', '/api/items/42',      None),
+  (2, 'GET', '/api/status.json',   None),
+  (2, 'GET', '/api/items/list',    None),
+  (1, 'PUT', '/api/items/42',      '{"name":"item"}'),
+  (1, 'GET', '/api/no/such/thing', None),
+)
+
+#------------------------------------------------------------------------------
+def makeApp(dispatcher=None, eager=False):
+  '''
+  Returns a WSGI application that has a :class:`RootController`
+  mounted at ``/api`` via ``config.add_controller()``. `dispatcher` is
+  a dict of :class:`pyramid_controllers.Dispatcher` constructor
+  parameters.
+  '''
+  config = Configurator(settings={})
+  config.include('pyramid_controllers')
+  config.add_controller(
+    'api', '/api', RootController(),
+    dispatcher=Dispatcher(**(dispatcher or {})), eager=eager)
+  return config.make_wsgi_app()
+
+#------------------------------------------------------------------------------
+def _makeEnviron(method, path, body):
+  req = Request.blank(path, method=method)
+  if body is not None:
+    req.body = body
+    req.content_type = 'application/json'
+  return req.environ
+
+#------------------------------------------------------------------------------
+def _call(app, environ):
+  status = []
+  def start_response(stat, headers, exc_info=None):
+    status.append(stat)
+  result = app(environ, start_response)
+  try:
+    for chunk in result:
+      pass
+  finally:
+    if hasattr(result, 'close'):
+      result.close()
+  return status[0]
+
+#------------------------------------------------------------------------------
+def _schedule(mix):
+  ret = []
+  for weight, method, path, body in mix:
+    ret.extend([(method, path, body)] * weight)
+  return ret
+
+#------------------------------------------------------------------------------
+def percentile(values, fraction):
+  '''
+  Returns the nearest-rank `fraction` percentile of the sorted list
+  `values`, e.g. ``percentile(values, 0.99)``.
+  '''
+  if not values:
+    return None
+  return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+#------------------------------------------------------------------------------
+def measureAllocations(app, mix=DEFAULT_MIX, number=200):
+  '''
+  Returns an adict with the average per-request allocations made while
+  serving `number` requests from `mix` on the current thread: `bytes`
+  and `blocks` if ``tracemalloc`` is available, otherwise `objects`,
+  the number of garbage-collector tracked objects created (and not
+  freed by reference counting) per request.
+  '''
+  schedule = _schedule(mix)
+  environs = [_makeEnviron(*schedule[idx % len(schedule)]) for idx in range(number)]
+  if tracemalloc is not None:
+    tracemalloc.start()
+    try:
+      before = tracemalloc.take_snapshot()
+      for environ in environs:
+        _call(app, environ)
+      stats = tracemalloc.take_snapshot().compare_to(before, 'filename')
+    finally:
+      tracemalloc.stop()
+    return adict(
+      bytes  = sum(stat.size_diff for stat in stats if stat.size_diff > 0) / float(number),
+      blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0) / float(number))
+  enabled = gc.isenabled()
+  gc.collect()
+  gc.disable()
+  try:
+    before = len(gc.get_objects())
+    for environ in environs:
+      _call(app, environ)
+    after = len(gc.get_objects())
+  finally:
+    if enabled:
+      gc.enable()
+  return adict(objects=( after - before ) / float(number))
+
+#------------------------------------------------------------------------------
+def run(threads=4, requests=10000, warmup=500, mix=DEFAULT_MIX,
+        dispatcher=None, eager=False, allocations=True):
+  '''
+  Runs the load test and returns the results as a JSON-serializable
+  dict: `requests` requests (after `warmup` unmeasured ones) from
+  `mix` are served by a pool of `threads` threads. `dispatcher` is a
+  dict of :class:`pyramid_controllers.Dispatcher` constructor
+  parameters and `eager` is passed to ``config.add_controller()``.
+  '''
+  app      = makeApp(dispatcher=dispatcher, eager=eager)
+  schedule = _schedule(mix)
+  for idx in range(warmup):
+    _call(app, _makeEnviron(*schedule[idx % len(schedule)]))
+  lock      = threading.Lock()
+  counter   = [0]
+  latencies = []
+  statuses  = dict()
+  def worker():
+    times = []
+    codes = dict()
+    while True:
+      with lock:
+        idx = counter[0]
+        counter[0] += 1
+      if idx >= requests:
+        break
+      environ = _makeEnviron(*schedule[idx % len(schedule)])
+      start   = timeit.default_timer()
+      status  = _call(app, environ)
+      times.append(timeit.default_timer() - start)
+      codes[status[:3]] = codes.get(status[:3], 0) + 1
+    with lock:
+      latencies.extend(times)
+      for code, count in codes.items():
+        statuses[code] = statuses.get(code, 0) + count
+  pool  = [threading.Thread(target=worker) for idx in range(threads)]
+  start = timeit.default_timer()
+  for thread in pool:
+    thread.start()
+  for thread in pool:
+    thread.join()
+  elapsed = timeit.default_timer() - start
+  latencies.sort()
+  ret = dict(
+    version    = getVersion(),
+    python     = platform.python_version(),
+    threads    = threads,
+    requests   = requests,
+    dispatcher = dict(dispatcher or {}),
+    eager      = bool(eager),
+    elapsed    = elapsed,
+    throughput = requests / elapsed if elapsed else None,
+    statuses   = statuses,
+    latency    = dict(
+      mean = sum(latencies) / len(latencies) if latencies else None,
+      p50  = percentile(latencies, 0.50),
+      p95  = percentile(latencies, 0.95),
+      p99  = percentile(latencies, 0.99),
+      max  = latencies[-1] if latencies else None,
+    ),
+  )
+  if allocations:
+    ret['allocations'] = dict(measureAllocations(app, mix=mix))
+  return ret
+
+#------------------------------------------------------------------------------
+def main(argv=None):
+  cli = argparse.ArgumentParser(
+    description='End-to-end WSGI load test of a pyramid-controllers application.')
+  cli.add_argument('--threads', type=int, default=4, help='worker threads (default: %(default)s)')
+  cli.add_argument('--requests', type=int, default=10000, help='measured requests (default: %(default)s)')
+  cli.add_argument('--warmup', type=int, default=500, help='unmeasured warmup requests (default: %(default)s)')
+  cli.add_argument('--plan-cache', type=int, default=0, metavar='SIZE', help='dispatcher `planCacheSize`')
+  cli.add_argument('--eager', action='store_true', help='compile the controller tree at configuration time')
+  cli.add_argument('--no-allocations', dest='allocations', action='store_false', help='skip the allocation measurement')
+  cli.add_argument('--output', metavar='FILENAME', help='save the JSON results to FILENAME')
+  options = cli.parse_args(argv)
+  results = run(
+    threads=options.threads, requests=options.requests, warmup=options.warmup,
+    dispatcher=dict(planCacheSize=options.plan_cache), eager=options.eager,
+    allocations=options.allocations)
+  output = json.dumps(results, indent=2, sort_keys=True)
+  if options.output:
+    with open(options.output, 'wb') as fp:
+      fp.write(output + '\n')
+  else:
+    sys.stdout.write(output + '\n')
+  return 0
+
+#------------------------------------------------------------------------------
+if __name__ == '__main__':
+  sys.exit(main())
+
+#------------------------------------------------------------------------------
+# end of $Id$
+#------------------------------------------------------------------------------
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#------------------------------------------------------------------------------
+# file: $Id$
+# lib:  pyramid_controllers.stream
+# date: 2026/10/17
+# copy: (C) Copyright 2026 Cadit Inc., see LICENSE.txt
+#------------------------------------------------------------------------------
+
+'''
+``pyramid_controllers.stream`` provides support for streaming the
+results of handlers that return generators or other iterators. The
+renderers in this module encode the items of the iterator lazily,
+i.e. as the WSGI server consumes the response's ``app_iter``, so that
+the result is never materialized in memory. They are registered by
+``config.include('pyramid_controllers')`` as:
+
+* ``ndjson``: newline-delimited JSON (one JSON document per item and
+  line), with the content-type ``application/x-ndjson``.
+
+* ``jsonstream``: a JSON array of the items, with the content-type
+  ``application/json``.
+
+For example::
+
+  @expose(renderer='ndjson')
+  def export(self, request):
+    for row in query_rows():
+      yield dict(id=row.id, name=row.name)
+
+Both renderers accept the same parameters as (and honor the adapters
+added to) a :class:`pyramid.renderers.JSON` renderer. Handlers that
+return an iterator and do not declare a renderer have the iterator's
+items (bytes or text) streamed as-is (see
+:meth:`pyramid_controllers.Dispatcher.render`).
+'''
+
+import six
+from zope.interface import providedBy
+from pyramid.interfaces import IJSONAdapter
+from pyramid.renderers import JSON
+
+#------------------------------------------------------------------------------
+def isStream(obj):
+  '''
+  Returns truthy if `obj` is an iterator (e.g. a generator), i.e. a
+  value that can only be iterated over once and should therefore be
+  streamed rather than rendered as a whole.
+  '''
+  return hasattr(obj, '__iter__') \
+    and hasattr(obj, '__next__' if six.PY3 else 'next') \
+    and not isinstance(obj, six.string_types + (six.binary_type,))
+
+#------------------------------------------------------------------------------
+def makeJsonDefault(renderer, request):
+  '''
+  Returns the `default` callback for JSON serializers that converts
+  objects that are not natively serializable for `request` the same
+  way that the :class:`pyramid.renderers.JSON` factory `renderer`
+  does, i.e. via their ``__json__`` method or the adapters that were
+  added to `renderer` (see :meth:`pyramid.renderers.JSON.add_adapter`).
+  '''
+  adapters = renderer.components.adapters
+  def default(obj):
+    if hasattr(obj, '__json__'):
+      return obj.__json__(request)
+    adapter = adapters.lookup((providedBy(obj),), IJSONAdapter, default=None)
+    if adapter is None:
+      raise TypeError('%r is not JSON serializable' % (obj,))
+    return adapter(obj, request)
+  return default
+
+#------------------------------------------------------------------------------
+def iterChunks(iterable, encode=None, encoding='utf-8',
+               prefix=None, separator=None, terminator=None, suffix=None):
+  '''
+  Generates the items of `iterable` as bytes. Each item is first
+  converted with `encode` (if specified) and text is then encoded
+  with `encoding`. If specified, `prefix` is generated first,
+  `separator` between items, `terminator` after each item and
+  `suffix` last. `iterable` is closed (if it supports that) when the
+  generator is exhausted or closed, e.g. by the WSGI server when the
+  client disconnects.
+  '''
+  try:
+    if prefix is not None:
+      yield prefix
+    first = True
+    for item in iterable:
+      if encode is not None:
+        item = encode(item)
+      if isinstance(item, six.text_type):
+        item = item.encode(encoding)
+      if separator is not None and not first:
+        item = separator + item
+      if terminator is not None:
+        item += terminator
+      first = False
+      yield item
+    if suffix is not None:
+      yield suffix
+  finally:
+    close = getattr(iterable, 'close', None)
+    if close is not None:
+      close()
+
+#------------------------------------------------------------------------------
+class NDJSON(JSON):
+  '''
+  A renderer factory that renders an iterable as newline-delimited
+  JSON (``application/x-ndjson``), serializing each item when it is
+  consumed. The constructor parameters are the same as for
+  :class:`pyramid.renderers.JSON`.
+  '''
+
+  contentType = 'application/x-ndjson'
+
+  #----------------------------------------------------------------------------
+  def __call__(self, info):
+    def _render(value, system):
+      request = system.get('request')
+      chunks  = self.iterate(value, self.makeEncoder(request))
+      if request is None:
+        return chunks
+      # note: the chunks are set as the response's `app_iter` directly
+      #       (and ``None`` is returned, which leaves the response as
+      #       is) so as not to depend on how pyramid converts other
+      #       renderer results to a response
+      response = request.response
+      if response.content_type == response.default_content_type:
+        response.content_type = self.contentType
+      response.app_iter = chunks
+      return None
+    return _render
+
+  #----------------------------------------------------------------------------
+  def makeEncoder(self, request):
+    default = makeJsonDefault(self, request)
+    def encode(item):
+      return self.serializer(item, default=default, **self.kw)
+    return encode
+
+  #----------------------------------------------------------------------------
+  def iterate(self, value, encode):
+    return iterChunks(value, encode, terminator=b'\n')
+
+#------------------------------------------------------------------------------
+class JSONArray(NDJSON):
+  '''
+  A renderer factory that renders an iterable as a JSON array
+  (``application/json``), serializing each item when it is consumed.
+  The constructor parameters are the same as for
+  :class:`pyramid.renderers.JSON`.
+  '''
+
+  contentType = 'application/json'
+
+  #----------------------------------------------------------------------------
+  def iterate(self, value, encode):
+    return iterChunks(value, encode, prefix=b'[', separator=b',', suffix=b']')
+
+#------------------------------------------------------------------------------
+# end of $Id$
+#------------------------------------------------------------------------------
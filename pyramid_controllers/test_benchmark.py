@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+#------------------------------------------------------------------------------
+# file: $Id$
+# lib:  pyramid_controllers.test_benchmark
+# date: 2026/10/17
+# copy: (C) Copyright 2026 Cadit Inc., see LICENSE.txt
+#------------------------------------------------------------------------------
+
+'''
+Unit test the pyramid-controllers dispatch benchmark and load harness.
+'''
+
+import unittest
+
+from pyramid_controllers import benchmark, loadtest
+
+#------------------------------------------------------------------------------
+class TestBenchmark(unittest.TestCase):
+
+  #----------------------------------------------------------------------------
+  def test_run(self):
+    # note: `run` verifies each scenario's response before timing it
+    tree = dict(depth=3, width=4, aliases=2, exts=1, lookups=True,
+                wrappers=2, rest=True)
+    for options in (dict(), dict(planCacheSize=10)):
+      result = benchmark.run(tree=tree, number=2, repeat=1, dispatcher=options)
+      self.assertEqual(
+        sorted(result['results'].keys()),
+        ['alias', 'ext', 'lookup', 'notfound', 'rest-get', 'rest-put',
+         'shallow', 'static'])
+      self.assertEqual(result['results']['alias']['path'], '/c0/c3/m3-a1')
+
+  #----------------------------------------------------------------------------
+  def test_compare(self):
+    base = dict(results=dict(a=dict(best=1.0), b=dict(best=1.0)))
+    cur  = dict(results=dict(a=dict(best=1.05), b=dict(best=1.5), c=dict(best=1.0)))
+    self.assertEqual(
+      [(item.name, item.regression) for item in benchmark.compare(cur, base, 0.1)],
+      [('a', False), ('b', True)])
+
+#------------------------------------------------------------------------------
+class TestLoadTest(unittest.TestCase):
+
+  #----------------------------------------------------------------------------
+  def test_run(self):
+    result = loadtest.run(threads=2, requests=20, warmup=10)
+    self.assertEqual(result['statuses'], {'200': 18, '404': 2})
+    self.assertTrue(result['latency']['p50'] <= result['latency']['p99'])
+    self.assertIn(
+      sorted(result['allocations'].keys()), (['objects'], ['blocks', 'bytes']))
+
+  #----------------------------------------------------------------------------
+  def test_percentile(self):
+    values = range(1, 101)
+    self.assertEqual(loadtest.percentile(values, 0.50), 50)
+    self.assertEqual(loadtest.percentile(values, 0.99), 99)
+    self.assertEqual(loadtest.percentile(values, 1.0), 100)
+    self.assertIsNone(loadtest.percentile([], 0.5))
+
+#------------------------------------------------------------------------------
+# end of $Id$
+#------------------------------------------------------------------------------
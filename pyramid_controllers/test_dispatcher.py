@@ -11,7 +11,7 @@
 Unit test the pyramid-controllers dispatching mechanisms.
 '''
 
-import unittest, urllib
+import unittest, urllib, threading, time, functools
 from pyramid import testing
 from pyramid.request import Request
 from pyramid.response import Response
@@ -22,9 +22,10 @@ from pyramid_controllers import \
     includeme, \
     Controller, Dispatcher, \
     expose, index, lookup, default, wrap, fiddle, expose_defaults
-from pyramid_controllers.decorator import PCATTR
+from pyramid_controllers.decorator import PCATTR, PCCTRLATTR
 from pyramid_controllers.util import getVersion
 from pyramid.config import Configurator
+from webtest import TestApp
 import six
 
 from .test_helpers import TestHelper
@@ -43,6 +44,89 @@ class TestDispatcher(TestHelper):
     config.add_controller('root', '/', Controller())
     self.assertEqual([v['route_name'] for v in views], ['root-index', 'root'])
 
+  #----------------------------------------------------------------------------
+  def test_eager_compile(self):
+    # 'add_controller can compile the entire controller tree up-front'
+    class Leaf(Controller):
+      @expose
+      def get(self, request): return 'leaf'
+    class Hidden(Controller):
+      leaf = Leaf
+      @index
+      def index(self, request): return 'hidden'
+    class Root(Controller):
+      sub = Leaf()
+      hidden = Hidden(expose=False)
+      @lookup
+      def _lookup(self, request, key, *rem):
+        return (self.hidden, rem)
+      @expose(name=('a', 'b'))
+      def method(self, request): return 'ok'
+    class CountingDispatcher(Dispatcher):
+      def makeMeta(self, controller):
+        compiled.append(controller)
+        return super(CountingDispatcher, self).makeMeta(controller)
+    compiled = []
+    root = Root()
+    stats = CountingDispatcher().compile(root)
+    self.assertEqual(sorted(c.__name__ for c in compiled), ['Hidden', 'Leaf', 'Root'])
+    self.assertEqual((stats.controllers, stats.handlers), (4, 4))
+    compiled = []
+    dispatcher = CountingDispatcher()
+    config = Configurator(settings={'pyramid_controllers.eager': 'true'})
+    config.include('pyramid_controllers')
+    config.add_controller('root', '/', Root(), dispatcher)
+    self.assertEqual(len(compiled), 3)
+    app = TestApp(config.make_wsgi_app())
+    self.assertResponse(app.get('/x/leaf/get'), 200, 'leaf')
+    self.assertEqual(len(compiled), 3)
+    compiled = []
+    config.add_controller('other', '/other', Root(), dispatcher, eager=False)
+    self.assertEqual(compiled, [])
+
+  #----------------------------------------------------------------------------
+  def test_shared_mounts(self):
+    # 'Shared controller mounts are resolved via a single route and a prefix trie'
+    from pyramid.exceptions import ConfigurationError
+    def makeController(label):
+      class Root(Controller):
+        @index
+        def index(self, request): return label + ':index'
+        @expose
+        def path(self, request):
+          return label + ':' + request.matchdict['pyramid_controllers_path']
+      return Root()
+    config = Configurator(settings={'pyramid_controllers.shared': 'true'})
+    config.include('pyramid_controllers')
+    config.add_controller('a', '/a', makeController('a'))
+    config.add_controller('ab', '/a/b/', makeController('ab'))
+    config.add_controller('t', '/tenant/x', makeController('t'))
+    config.add_controller('other', '/other', makeController('other'), shared=False)
+    self.assertRaises(
+      ConfigurationError,
+      config.add_controller, 'dup', '/a', makeController('dup'))
+    self.assertRaises(
+      ConfigurationError,
+      config.add_controller, 'var', '/v/{id}', makeController('var'))
+    self.assertRaises(
+      ConfigurationError,
+      config.add_controller, 'kw', '/kw', makeController('kw'), request_method='GET')
+    app = TestApp(config.make_wsgi_app())
+    self.assertResponse(app.get('/a/', status='*'), 200, 'a:index')
+    self.assertResponse(app.get('/a', status='*'), 200, 'a:index')
+    self.assertResponse(app.get('/other', status='*'), 200, 'other:index')
+    self.assertResponse(app.get('/a/path', status='*'), 200, 'a:/path')
+    self.assertResponse(app.get('/a/b/path', status='*'), 200, 'ab:/path')
+    self.assertResponse(app.get('/a/bb/path', status='*'), 404)
+    self.assertResponse(app.get('/tenant/x/path', status='*'), 200, 't:/path')
+    self.assertResponse(app.get('/tenant/path', status='*'), 404)
+    self.assertResponse(app.get('/other/path', status='*'), 200, 'other:/path')
+    self.assertResponse(app.get('/nothing', status='*'), 404)
+    config.add_controller('root', '/', makeController('root'))
+    app = TestApp(config.make_wsgi_app())
+    self.assertResponse(app.get('/nothing/../path', status='*'), 200, 'root:/nothing/../path')
+    self.assertResponse(app.get('/a/b/', status='*'), 200, 'ab:index')
+
   #----------------------------------------------------------------------------
   def test_version(self):
     v = getVersion()
@@ -252,8 +336,23 @@ class TestDispatcher(TestHelper):
     self.assertResponse(self.send(Root(), '/'), 200, 'method is GET')
     self.assertResponse(self.send(Root(), '/', method='PUT'), 200, 'method is PUT (PorP)')
     self.assertResponse(self.send(Root(), '/', method='POST'), 200, 'method is POST (PorP)')
-    # TODO: this should return a 405...
-    self.assertResponse(self.send(Root(), '/', method='DELETE'), 404)
+    res = self.assertResponse(self.send(Root(), '/', method='DELETE'), 405)
+    self.assertEqual(res.headers['Allow'], 'GET, POST, PUT')
+
+  def test_index_method_buckets(self):
+    # '@index/@default handlers are pre-sorted into per-method buckets'
+    class Root(Controller):
+      @index(method='GET')
+      def index_get(self, request): return 'get'
+      @index
+      def index_any(self, request): return 'any'
+    # note: this is violating the abstraction barrier... oh well. testing
+    #       the i-rep!... :)
+    root = Root()
+    ops  = Dispatcher().makeMeta(root).ops['index']
+    self.assertEqual(sorted(ops.keys()), [None, 'GET'])
+    self.assertEqual(ops['GET'][1], ('index_any', 'index_get'))
+    self.assertEqual(ops[None][1], ('index_any',))
 
   #----------------------------------------------------------------------------
   # TEST @EXPOSE
@@ -320,8 +419,9 @@ class TestDispatcher(TestHelper):
     self.assertResponse(self.send(Root(), '/res'), 200, 'res with GET')
     self.assertResponse(self.send(Root(), '/res', method='PUT'), 200, 'res with PUT (PorP)')
     self.assertResponse(self.send(Root(), '/res', method='POST'), 200, 'res with POST (PorP)')
-    # TODO: this should probably return a 405...
-    self.assertResponse(self.send(Root(), '/res', method='DELETE'), 404)
+    res = self.assertResponse(self.send(Root(), '/res', method='DELETE'), 405)
+    self.assertEqual(res.headers['Allow'], 'GET, POST, PUT')
+    self.assertResponse(self.send(Root(), '/other', method='DELETE'), 404)
 
   def test_expose_on_bound_method(self):
     # '@expose on a bound method'
@@ -493,6 +593,33 @@ class TestDispatcher(TestHelper):
     self.assertResponse(self.send(Ext(), '/test_sub2/foo'),       200, 'path:/test_sub2/foo')
     self.assertResponse(self.send(Ext(), '/test-sub2/foo'),       404)
 
+  def test_dispatch_table(self):
+    # 'Controllers are compiled into a segment-to-candidates dispatch table'
+    class Sub(Controller):
+      @index
+      def index(self, request): return 'sub'
+    class Root(Controller):
+      sub_ctrl = Sub()
+      hidden = Sub(expose=False)
+      @expose
+      def some_method(self, request): return 'ok'
+      @expose(name='res', method='GET')
+      def res_get(self, request): return 'get'
+      @expose(name='res', method=('PUT', 'POST'))
+      def res_put(self, request): return 'put'
+    # note: this is violating the abstraction barrier... oh well. testing
+    #       the i-rep!... :)
+    root  = Root()
+    table = Dispatcher().makeMeta(root).table
+    self.assertEqual(table['sub_ctrl'], (('sub_ctrl', None),))
+    self.assertEqual(table['sub-ctrl'], (('sub_ctrl', None),))
+    self.assertEqual(table['some-method'], (('some_method', None),))
+    self.assertEqual(
+      table['res'],
+      (('res_get', frozenset(['GET'])), ('res_put', frozenset(['PUT', 'POST']))))
+    self.assertNotIn('hidden', table)
+    self.assertNotIn('res_get', table)
+
   #----------------------------------------------------------------------------
   # TEST @FIDDLE
   #----------------------------------------------------------------------------
@@ -612,6 +739,48 @@ class TestDispatcher(TestHelper):
       sub = Sub()
     self.assertResponse(self.send(Root(), '/sub/data'), 200, 'ok.sub.root')
 
+  def test_wrap_chain_cached(self):
+    # 'composed @wrap chains are cached per wrappers/handler combination'
+    calls = []
+    class Sub(Controller):
+      @wrap
+      def _wrap(self, request, handler):
+        calls.append('sub')
+        return handler(request) + '.sub'
+      @expose
+      def data(self, request):
+        return 'ok'
+    class Root(Controller):
+      @wrap
+      def _wrap(self, request, handler):
+        calls.append('root')
+        return handler(request) + '.root'
+      sub = Sub()
+    root = Root()
+    dispatcher = Dispatcher()
+    self.assertResponse(self.send(root, '/sub/data', dispatcher=dispatcher), 200, 'ok.sub.root')
+    self.assertEqual(len(dispatcher.chains), 1)
+    chain = list(dispatcher.chains.values())[0]
+    self.assertResponse(self.send(root, '/sub/data', dispatcher=dispatcher), 200, 'ok.sub.root')
+    self.assertEqual(list(dispatcher.chains.values()), [chain])
+    self.assertEqual(calls, ['root', 'sub', 'root', 'sub'])
+
+  def test_wrap_retry(self):
+    # 'a @wrap can invoke the wrapped handler more than once'
+    class Sub(Controller):
+      @wrap
+      def _wrap(self, request, handler):
+        return '(' + handler(request) + ')'
+      @expose
+      def data(self, request):
+        return 'ok'
+    class Root(Controller):
+      @wrap
+      def _wrap(self, request, handler):
+        return handler(request) + '|' + handler(request)
+      sub = Sub()
+    self.assertResponse(self.send(Root(), '/sub/data'), 200, '(ok)|(ok)')
+
   #----------------------------------------------------------------------------
   # TEST @LOOKUP
   #----------------------------------------------------------------------------
@@ -648,6 +817,125 @@ class TestDispatcher(TestHelper):
     self.assertResponse(self.send(Root(), '/foo/echo'), 200, 'ok.sub.echo:foo')
     self.assertResponse(self.send(Root(), '/sub/echo'), 200, 'ok.sub.echo:None')
 
+  def test_lookup_cache(self):
+    # 'Cached @lookup results are replayed, including request attributes'
+    from pyramid_controllers import LookupCache
+    calls = []
+    cache = LookupCache(size=2, attrs=('res',))
+    class Sub(Controller):
+      @expose
+      def echo(self, request):
+        return 'ok.echo:%s,%s' % (request.res, getattr(request, 'other', None))
+    class Lookup(Controller):
+      SUB = Sub(expose=False)
+      @lookup(cache=cache)
+      def _lookup(self, request, res_id, *rem):
+        calls.append(res_id)
+        request.res   = 'res-' + res_id
+        request.other = 'other'
+        if res_id == 'skip':
+          return (self.SUB, ('echo',))
+        return (self.SUB, rem)
+    class Root(Controller):
+      lookup = Lookup()
+    root = Root()
+    self.assertResponse(self.send(root, '/lookup/a/echo'), 200, 'ok.echo:res-a,other')
+    for count in range(2):
+      self.assertResponse(self.send(root, '/lookup/a/echo'), 200, 'ok.echo:res-a,None')
+    self.assertEqual(calls, ['a'])
+    self.assertResponse(self.send(root, '/lookup/b/echo'), 200, 'ok.echo:res-b,other')
+    self.assertResponse(self.send(root, '/lookup/a/echo'), 200, 'ok.echo:res-a,None')
+    self.assertEqual(calls, ['a', 'b'])
+    cache.invalidate('a')
+    self.assertResponse(self.send(root, '/lookup/a/echo'), 200, 'ok.echo:res-a,other')
+    self.assertEqual(calls, ['a', 'b', 'a'])
+    # results that do not consume exactly the declared components are not cached
+    self.assertResponse(self.send(root, '/lookup/skip/x'), 200, 'ok.echo:res-skip,other')
+    self.assertResponse(self.send(root, '/lookup/skip/x'), 200, 'ok.echo:res-skip,other')
+    self.assertEqual(calls, ['a', 'b', 'a', 'skip', 'skip'])
+    # ttl-based expiry
+    class TtlRoot(Controller):
+      @lookup(cache=dict(ttl=-1, attrs=['res']))
+      def _lookup(self, request, res_id, *rem):
+        calls.append(res_id)
+        request.res = res_id
+        return (Lookup.SUB, rem)
+    del calls[:]
+    root = TtlRoot()
+    self.assertResponse(self.send(root, '/c/echo'), 200, 'ok.echo:c,None')
+    self.assertResponse(self.send(root, '/c/echo'), 200, 'ok.echo:c,None')
+    self.assertEqual(calls, ['c', 'c'])
+
+  def test_lookup_cache_per_controller(self):
+    # 'Controllers that inherit a cached @lookup do not share results'
+    class Child(Controller):
+      def __init__(self, value, *args, **kw):
+        super(Child, self).__init__(*args, **kw)
+        self.value = value
+      @expose
+      def who(self, request):
+        return self.value
+    class Base(Controller):
+      label = 'A'
+      @lookup(cache=True)
+      def _lookup(self, request, key, *rem):
+        calls.append(self.label + ':' + key)
+        return (Child(self.label + ':' + key), rem)
+    class Groups(Base):
+      label = 'G'
+    class Root(Controller):
+      users  = Base()
+      groups = Groups
+    calls = []
+    root = Root()
+    self.assertResponse(self.send(root, '/users/1/who'), 200, 'A:1')
+    self.assertResponse(self.send(root, '/groups/1/who'), 200, 'G:1')
+    self.assertResponse(self.send(root, '/users/1/who'), 200, 'A:1')
+    # instances of the same class, e.g. per-request controllers, share results
+    self.assertResponse(self.send(root, '/groups/1/who'), 200, 'G:1')
+    self.assertEqual(calls, ['A:1', 'G:1'])
+
+  def test_lookup_cache_non_function(self):
+    # 'Cached @lookup handlers that are not functions are not cached'
+    class Child(Controller):
+      @expose
+      def who(self, request):
+        return request.key
+    class Finder(object):
+      def __call__(self, request, key, *rem):
+        calls.append(key)
+        request.key = key
+        return (Child(), rem)
+    def find(finder, request, key, *rem):
+      return finder(request, key, *rem)
+    class Root(Controller):
+      _lookup = lookup(cache=True)(functools.partial(find, Finder()))
+    class Other(Controller):
+      _lookup = lookup(cache=True)(Finder())
+    calls = []
+    for root in (Root(), Other()):
+      for count in range(2):
+        self.assertResponse(self.send(root, '/1/who'), 200, '1')
+    self.assertEqual(calls, ['1', '1', '1', '1'])
+
+  def test_lookup_deep_chain(self):
+    # 'Deep controller and @lookup chains do not recurse'
+    import sys
+    class Node(Controller):
+      @lookup
+      def _lookup(self, request, value, *rem):
+        request.depth = getattr(request, 'depth', 0) + 1
+        return (self.node, rem)
+      @expose
+      def end(self, request):
+        return 'ok.depth:%d' % (request.depth,)
+    Node.node = Node()
+    Node.sub = Node.node
+    depth = sys.getrecursionlimit() + 100
+    self.assertResponse(
+      self.send(Node(), '/x/sub' * ( depth // 2 ) + '/end'),
+      200, 'ok.depth:%d' % (depth // 2,))
+
   #----------------------------------------------------------------------------
   # TEST @DEFAULT
   #----------------------------------------------------------------------------
@@ -696,8 +984,747 @@ class TestDispatcher(TestHelper):
     self.assertResponse(self.send(Root(), '/res'), 200, 'default GET')
     self.assertResponse(self.send(Root(), '/res', method='PUT'), 200, 'default PUT (PorP)')
     self.assertResponse(self.send(Root(), '/res', method='POST'), 200, 'default POST (PorP)')
-    # TODO: this should probably return a 405...
-    self.assertResponse(self.send(Root(), '/res', method='DELETE'), 404)
+    res = self.assertResponse(self.send(Root(), '/res', method='DELETE'), 405)
+    self.assertEqual(res.headers['Allow'], 'GET, POST, PUT')
+
+  #----------------------------------------------------------------------------
+  # TEST PATH NORMALIZATION
+  #----------------------------------------------------------------------------
+
+  def test_split_path(self):
+    from pyramid_controllers.util import splitPath
+    self.assertEqual(splitPath(''),              ('',))
+    self.assertEqual(splitPath('/'),             ('',))
+    self.assertEqual(splitPath('/../..'),        ('',))
+    self.assertEqual(splitPath('/a//./b/../c/'), ('a', 'c', ''))
+    self.assertEqual(splitPath('/a/b/..'),       ('a',))
+    self.assertEqual(splitPath('/a%2F..%2fb'),   ('a/../b',))
+    self.assertEqual(splitPath('/%2e%2e/x'),     ('..', 'x'))
+
+  def test_path_cache(self):
+    class Root(Controller):
+      @expose
+      def method(self, request): return 'ok.method'
+    dispatcher = Dispatcher(pathCacheSize=1)
+    root = Root()
+    self.assertResponse(self.send(root, '/x/../method', dispatcher=dispatcher), 200, 'ok.method')
+    self.assertResponse(self.send(root, '/x/../method', dispatcher=dispatcher), 200, 'ok.method')
+    self.assertResponse(self.send(root, '/method', dispatcher=dispatcher), 200, 'ok.method')
+    self.assertEqual(
+      dispatcher.paths.stats(),
+      dict(size=1, maxsize=1, hits=1, misses=2, evictions=1))
+
+  #----------------------------------------------------------------------------
+  # TEST CONTROLLER METADATA CACHING
+  #----------------------------------------------------------------------------
+
+  def test_class_meta_cache(self):
+    # 'Controller metadata is compiled once per class, not per instance'
+    class CountingDispatcher(Dispatcher):
+      compiled = []
+      def makeMeta(self, controller):
+        self.compiled.append(controller)
+        return super(CountingDispatcher, self).makeMeta(controller)
+    class Item(Controller):
+      @expose
+      def name(self, request): return 'item:' + request.path
+    class Root(Controller):
+      item = Item
+      @property
+      def prop(self):
+        return Item(expose=True)
+    root = Root()
+    dispatcher = CountingDispatcher()
+    for count in range(3):
+      self.assertResponse(self.send(root, '/item/name', dispatcher=dispatcher),
+                          200, 'item:/item/name')
+    self.assertEqual(dispatcher.compiled, [Root, Item])
+    # descriptors are evaluated per request
+    self.assertResponse(self.send(root, '/prop/name', dispatcher=dispatcher),
+                        200, 'item:/prop/name')
+    # instance-level handlers are honored
+    other = Root()
+    other.extra = Item()
+    self.assertResponse(self.send(root, '/extra/name', dispatcher=dispatcher), 404)
+    self.assertResponse(self.send(other, '/extra/name', dispatcher=dispatcher),
+                        200, 'item:/extra/name')
+
+  #----------------------------------------------------------------------------
+  def test_get_entries_of_class(self):
+    # 'Controller classes (not only instances) can be inspected'
+    class Sub(Controller):
+      @expose
+      def leaf(self, request): return 'leaf'
+    class Root(Controller):
+      sub = Sub()
+      @index
+      def index(self, request): return 'index'
+      @expose(name=['data', 'info'])
+      def data(self, request): return 'data'
+      @lookup
+      def _lookup(self, request, key, *rem): return (Sub(), rem)
+    dispatcher = Dispatcher()
+    names = [name for name, attr in dispatcher.getEntries(Root)]
+    self.assertNotIn(dispatcher.PCATTR, vars(Root))
+    self.assertEqual(names, [name for name, attr in dispatcher.getEntries(Root())])
+    for name in (dispatcher.NAME_INDEX, 'data', 'info', 'sub', dispatcher.NAME_LOOKUP):
+      self.assertIn(name, names)
+
+  #----------------------------------------------------------------------------
+  def test_descriptor_subcontroller_per_request(self):
+    # 'Descriptor-based sub-controllers are evaluated on every request'
+    class Item(Controller):
+      def __init__(self, value, *args, **kw):
+        super(Item, self).__init__(*args, **kw)
+        self.value = value
+      @expose
+      def name(self, request): return self.value
+    class Root(Controller):
+      @property
+      def item(self):
+        counter[0] += 1
+        return Item('item%d' % (counter[0],))
+    counter = [0]
+    root = Root()
+    dispatcher = Dispatcher()
+    self.assertResponse(self.send(root, '/item/name', dispatcher=dispatcher), 200, 'item1')
+    self.assertResponse(self.send(root, '/item/name', dispatcher=dispatcher), 200, 'item2')
+    # ... even if the plan cache is enabled
+    dispatcher = Dispatcher(planCacheSize=10)
+    self.assertResponse(self.send(root, '/item/name', dispatcher=dispatcher), 200, 'item3')
+    self.assertResponse(self.send(root, '/item/name', dispatcher=dispatcher), 200, 'item4')
+    self.assertEqual(len(dispatcher.plans), 0)
+
+  #----------------------------------------------------------------------------
+  def test_class_meta_cache_threaded(self):
+    # 'Concurrent cold requests compile each controller class exactly once'
+    class SlowDispatcher(Dispatcher):
+      def makeMeta(self, controller):
+        with lock:
+          compiled.append(controller)
+        # widen the window in which a racing thread could observe
+        # partially compiled metadata
+        time.sleep(0.005)
+        return super(SlowDispatcher, self).makeMeta(controller)
+    def makeRoot():
+      @expose_defaults(ext='txt', renderer='repr')
+      class Base(Controller):
+        @expose
+        def name(self, request): return dict(name=request.path)
+      class Leaf(Base):
+        @expose(ext=None)
+        def raw(self, request): return 'raw:' + request.path
+      class Root(Controller):
+        sub  = Leaf()
+        item = Leaf
+      return Root()
+    paths = {
+      '/sub/name.txt'  : (200, "{'name': '/sub/name.txt'}"),
+      '/sub/raw'       : (200, 'raw:/sub/raw'),
+      '/item/name.txt' : (200, "{'name': '/item/name.txt'}"),
+      '/item/name'     : (404, None),
+      '/sub/raw.txt'   : (404, None),
+    }
+    lock = threading.Lock()
+    for count in range(3):
+      compiled   = []
+      results    = []
+      start      = threading.Event()
+      dispatcher = SlowDispatcher()
+      app        = TestApp(self.makeApp(makeRoot(), dispatcher=dispatcher))
+      def worker(path):
+        start.wait()
+        res = app.get(path, status='*')
+        with lock:
+          results.append((path, res.status_code, res.body))
+      threads = [threading.Thread(target=worker, args=(path,))
+                 for path in sorted(paths.keys()) * 4]
+      for thread in threads:
+        thread.start()
+      start.set()
+      for thread in threads:
+        thread.join()
+      self.assertEqual(
+        sorted(c.__name__ for c in compiled), ['Leaf', 'Root'])
+      self.assertEqual(len(results), len(threads))
+      for path, status, body in results:
+        self.assertEqual(status, paths[path][0])
+        if paths[path][1] is not None:
+          self.assertEqual(body, paths[path][1])
+
+  #----------------------------------------------------------------------------
+  # TEST RESOLUTION PLAN CACHING
+  #----------------------------------------------------------------------------
+
+  def test_plan_cache(self):
+    # 'Static routes are resolved once and then replayed from the plan cache'
+    class Sub(Controller):
+      @fiddle
+      def _fiddle(self, request):
+        request.fiddled = True
+      @wrap
+      def _wrap(self, request, handler):
+        return handler(request) + '.wrapped'
+      @expose(method='GET')
+      def data(self, request):
+        return 'ok:fiddled=%r' % (getattr(request, 'fiddled', False),)
+    class Lookup(Controller):
+      @lookup
+      def _lookup(self, request, value, *rem):
+        return (Sub(), rem)
+    class Root(Controller):
+      sub = Sub()
+      lookup = Lookup()
+    root = Root()
+    dispatcher = Dispatcher(planCacheSize=10)
+    for count in range(3):
+      self.assertResponse(self.send(root, '/sub/data', dispatcher=dispatcher),
+                          200, 'ok:fiddled=True.wrapped')
+      self.assertResponse(self.send(root, '/lookup/x/data', dispatcher=dispatcher),
+                          200, 'ok:fiddled=True.wrapped')
+    self.assertResponse(self.send(root, '/sub/data', method='PUT', dispatcher=dispatcher), 405)
+    self.assertEqual(len(dispatcher.plans), 1)
+    self.assertEqual(dispatcher.plans.stats().hits, 2)
+    dispatcher.invalidate()
+    self.assertEqual(len(dispatcher.plans), 0)
+    self.assertResponse(self.send(root, '/sub/data', dispatcher=dispatcher),
+                        200, 'ok:fiddled=True.wrapped')
+    self.assertEqual(len(dispatcher.plans), 1)
+
+  #----------------------------------------------------------------------------
+  # TEST ALLOWED METHODS
+  #----------------------------------------------------------------------------
+
+  def test_auto_options(self):
+    # 'OPTIONS requests can be answered from the compiled method sets'
+    from pyramid_controllers import RestController
+    class Rest(RestController):
+      @expose
+      def get(self, request): return 'get'
+      @expose
+      def put(self, request): return 'put'
+    class Root(Controller):
+      rest = Rest()
+      @fiddle
+      def _fiddle(self, request):
+        calls.append('fiddle')
+      @wrap
+      def _wrap(self, request, handler):
+        calls.append('wrap')
+        return handler(request)
+      @expose(method=('GET', 'post'))
+      def data(self, request): return 'data'
+      @expose(method='OPTIONS')
+      def custom(self, request): return 'custom'
+    calls = []
+    app = TestApp(self.makeApp(Root(), dispatcher=Dispatcher(autoOptions=True)))
+    res = self.assertResponse(app.options('/data'), 200, '')
+    self.assertEqual(res.headers['Allow'], 'GET, OPTIONS, POST')
+    self.assertNotIn('Access-Control-Allow-Methods', res.headers)
+    res = self.assertResponse(app.options('/rest', headers={
+      'Origin': 'http://example.com', 'Access-Control-Request-Method': 'PUT',
+      'Access-Control-Request-Headers': 'X-Token'}), 200, '')
+    self.assertEqual(res.headers['Allow'], 'GET, OPTIONS, PUT')
+    self.assertEqual(res.headers['Access-Control-Allow-Methods'], 'GET, OPTIONS, PUT')
+    self.assertEqual(res.headers['Access-Control-Allow-Headers'], 'X-Token')
+    self.assertEqual(app.options('/custom').headers['Allow'], 'OPTIONS')
+    self.assertResponse(app.options('/nothing', status='*'), 404)
+    self.assertEqual(calls, [])
+    res = self.assertResponse(app.delete('/data', status='*'), 405)
+    self.assertEqual(res.headers['Allow'], 'GET, OPTIONS, POST')
+    # without `autoOptions`, OPTIONS requests are dispatched normally
+    self.assertResponse(self.send(Root(), '/custom', method='OPTIONS'), 200, 'custom')
+    self.assertResponse(self.send(Root(), '/data', method='OPTIONS'), 405)
+
+  #----------------------------------------------------------------------------
+  def test_fast_head(self):
+    # 'HEAD requests can be resolved to GET handlers and skip rendering'
+    from pyramid_controllers import RestController
+    def counted(info):
+      def _render(value, system):
+        calls.append('render')
+        system['request'].response.content_type = 'text/x-counted'
+        return repr(value)
+      return _render
+    self.renderers['counted'] = counted
+    class Rest(RestController):
+      @expose(renderer='json')
+      def get(self, request):
+        calls.append('get')
+        return dict(rest=1)
+    class Root(Controller):
+      rest = Rest()
+      @expose(method='GET', renderer='json', contentLength=lambda request: 11)
+      def data(self, request):
+        calls.append('data')
+        request.response.status = 201
+        request.response.headers['X-Data'] = 'yes'
+        return dict(data=1)
+      @expose(renderer='counted', head=True)
+      def full(self, request):
+        calls.append('full')
+        return dict(full=1)
+      @expose(renderer='counted')
+      def custom(self, request):
+        calls.append('custom')
+        return dict(custom=1)
+    calls = []
+    app = TestApp(self.makeApp(Root(), dispatcher=Dispatcher(fastHead=True)))
+    # the HEAD response is identical to the GET response, sans body
+    get  = self.assertResponse(app.get('/data'), 200, '{"data": 1}')
+    head = self.assertResponse(app.head('/data'), 200, '')
+    self.assertEqual(sorted(head.headers.items()), sorted(get.headers.items()))
+    self.assertEqual(head.content_type, 'application/json')
+    self.assertNotIn('X-Data', head.headers)
+    calls = []
+    res = self.assertResponse(app.head('/rest'), 200, '')
+    self.assertNotIn('Content-Length', res.headers)
+    self.assertEqual(res.content_type, 'application/json')
+    self.assertEqual(calls, ['get'])
+    # results of renderers with an unknown content type are rendered
+    calls = []
+    res = self.assertResponse(app.head('/full'), 200, '')
+    self.assertEqual(res.content_type, 'text/x-counted')
+    res = self.assertResponse(app.head('/custom'), 200, '')
+    self.assertEqual(res.content_type, 'text/x-counted')
+    self.assertEqual(calls, ['full', 'render', 'custom', 'render'])
+    # without `fastHead`, HEAD requests are dispatched normally
+    self.assertResponse(self.send(Root(), '/data', method='HEAD'), 405)
+    self.assertResponse(self.send(Root(), '/rest', method='HEAD'), 405)
+
+  #----------------------------------------------------------------------------
+  def test_renderer_helper_reuse(self):
+    # 'Renderers are instantiated once per renderer, package and registry'
+    def counted(info):
+      calls.append(info.package)
+      def _render(value, system):
+        return '%s:%r' % (system['renderer_name'], value)
+      return _render
+    self.renderers['counted'] = counted
+    class Root(Controller):
+      @expose(renderer='counted')
+      def data(self, request):
+        return dict(v=str(request.params.get('v', 'x')))
+      @expose(renderer='counted')
+      def other(self, request):
+        return dict(v='other')
+    calls = []
+    dispatcher = Dispatcher()
+    app = TestApp(self.makeApp(Root(), dispatcher=dispatcher))
+    self.assertResponse(app.get('/data'), 200, "counted:{'v': 'x'}")
+    self.assertResponse(app.get('/data?v=y'), 200, "counted:{'v': 'y'}")
+    self.assertResponse(app.get('/other'), 200, "counted:{'v': 'other'}")
+    self.assertEqual(calls, [__name__])
+    dispatcher.invalidate()
+    self.assertResponse(app.get('/data'), 200, "counted:{'v': 'x'}")
+    self.assertEqual(calls, [__name__, __name__])
+
+  #----------------------------------------------------------------------------
+  def test_fast_json(self):
+    # 'JSON results can be serialized without the generic renderer machinery'
+    import json
+    from pyramid.renderers import JSON
+    class Point(object):
+      def __init__(self, x):
+        self.x = x
+    def encoder(value, default):
+      calls.append('encode')
+      return json.dumps(value, default=default, sort_keys=True)
+    def addAdapter(config):
+      renderer = JSON(separators=(',', ':'), sort_keys=True)
+      renderer.add_adapter(Point, lambda obj, request: dict(x=obj.x))
+      config.add_renderer('json', renderer)
+      config.add_subscriber(lambda event: calls.append('request'), 'pyramid.events.NewRequest')
+    def addRenderSubscriber(config):
+      addAdapter(config)
+      config.add_subscriber(lambda event: calls.append('event'), 'pyramid.events.BeforeRender')
+    class Root(Controller):
+      @expose(renderer='json')
+      def point(self, request):
+        return dict(point=Point(3), b=[1])
+      @expose(renderer='json')
+      def mutated(self, request):
+        request.response.status = 201
+        request.response.content_type = 'application/vnd.point+json'
+        request.response.headers['X-Foo'] = 'bar'
+        return dict(point=Point(4))
+    # the output is identical to the generic path's
+    calls = []
+    for path in ('/point', '/mutated'):
+      responses = []
+      for fastJson in (False, True):
+        app = TestApp(self.makeApp(
+          Root(), dispatcher=Dispatcher(fastJson=fastJson), config_hook=addAdapter))
+        responses.append(app.get(path))
+      self.assertEqual(responses[1].status, responses[0].status)
+      self.assertEqual(responses[1].headerlist, responses[0].headerlist)
+      self.assertEqual(responses[1].body, responses[0].body)
+    self.assertEqual(responses[1].body, '{"point":{"x":4}}')
+    self.assertEqual(responses[1].content_type, 'application/json')
+    # custom encoders (but not other subscribers) are used
+    calls = []
+    app = TestApp(self.makeApp(
+      Root(), dispatcher=Dispatcher(fastJson=encoder), config_hook=addAdapter))
+    self.assertResponse(app.get('/point'), 200, '{"b": [1], "point": {"x": 3}}')
+    self.assertEqual(calls, ['request', 'encode'])
+    # BeforeRender subscribers disable the fast path
+    calls = []
+    app = TestApp(self.makeApp(
+      Root(), dispatcher=Dispatcher(fastJson=encoder), config_hook=addRenderSubscriber))
+    self.assertResponse(app.get('/point'), 200, '{"b":[1],"point":{"x":3}}')
+    self.assertEqual(calls, ['request', 'event'])
+
+  #----------------------------------------------------------------------------
+  def test_json_default(self):
+    # 'JSON defaults honor __json__ and the adapters of a JSON renderer'
+    from pyramid.renderers import JSON
+    from pyramid_controllers.stream import makeJsonDefault
+    class Point(object):
+      x = 1
+    class Custom(object):
+      def __json__(self, request):
+        return 'custom:' + request
+    renderer = JSON()
+    renderer.add_adapter(Point, lambda obj, request: dict(x=obj.x, r=request))
+    default = makeJsonDefault(renderer, 'req')
+    self.assertEqual(default(Point()), dict(x=1, r='req'))
+    self.assertEqual(default(Custom()), 'custom:req')
+    self.assertRaises(TypeError, default, object())
+
+  #----------------------------------------------------------------------------
+  def test_streaming(self):
+    # 'Iterator results are streamed lazily as the response app_iter'
+    class Root(Controller):
+      @expose(renderer='ndjson', cache=True)
+      def rows(self, request):
+        for idx in range(3):
+          calls.append(idx)
+          yield dict(id=idx)
+      @expose(renderer='jsonstream')
+      def array(self, request):
+        return iter([dict(id=0), u'é'])
+      @expose(renderer='jsonstream')
+      def empty(self, request):
+        return iter([])
+      @expose
+      def raw(self, request):
+        request.response.content_type = 'text/csv'
+        return iter(['a,b\n', u'é,2\n'])
+    calls = []
+    app = TestApp(self.makeApp(Root()))
+    res = self.assertResponse(app.get('/rows'), 200, '{"id": 0}\n{"id": 1}\n{"id": 2}\n')
+    self.assertEqual(res.content_type, 'application/x-ndjson')
+    self.assertResponse(app.get('/rows'), 200, '{"id": 0}\n{"id": 1}\n{"id": 2}\n')
+    self.assertEqual(calls, [0, 1, 2, 0, 1, 2])
+    res = self.assertResponse(app.get('/array'), 200, '[{"id": 0},"\\u00e9"]')
+    self.assertEqual(res.content_type, 'application/json')
+    self.assertResponse(app.get('/empty'), 200, '[]')
+    res = self.assertResponse(app.get('/raw'), 200, 'a,b\n\xc3\xa9,2\n')
+    self.assertEqual(res.content_type, 'text/csv')
+
+  #----------------------------------------------------------------------------
+  def test_streaming_is_lazy(self):
+    # 'Streamed items are only encoded when consumed and closed on close'
+    from pyramid_controllers.stream import NDJSON
+    def rows():
+      try:
+        for idx in range(1000000):
+          events.append(idx)
+          yield dict(id=idx)
+      finally:
+        events.append('closed')
+    events = []
+    render = NDJSON()(None)
+    request = testing.DummyRequest()
+    self.assertIsNone(render(rows(), dict(request=request)))
+    result = request.response.app_iter
+    self.assertEqual(events, [])
+    self.assertEqual(next(result), b'{"id": 0}\n')
+    self.assertEqual(next(result), b'{"id": 1}\n')
+    result.close()
+    self.assertEqual(events, [0, 1, 'closed'])
+    self.assertEqual(request.response.content_type, 'application/x-ndjson')
+
+  #----------------------------------------------------------------------------
+  # TEST RESPONSE CACHING
+  #----------------------------------------------------------------------------
+
+  def test_response_cache(self):
+    # 'Handlers can declare a server-side response cache'
+    @expose_defaults(cache=dict(vary='Accept'))
+    class Root(Controller):
+      @fiddle
+      def _fiddle(self, request):
+        calls.append('fiddle')
+      @wrap
+      def _wrap(self, request, handler):
+        calls.append('wrap')
+        return handler(request)
+      @expose(renderer='repr')
+      def data(self, request):
+        calls.append('data')
+        return dict(q=request.params.get('q'))
+      @expose(cache=False)
+      def live(self, request):
+        calls.append('live')
+        return 'live'
+      @expose
+      def error(self, request):
+        calls.append('error')
+        raise HTTPNotFound()
+    calls = []
+    dispatcher = Dispatcher()
+    app = TestApp(self.makeApp(Root(), dispatcher=dispatcher))
+    self.assertResponse(app.get('/data'), 200, "{'q': None}")
+    self.assertEqual(calls, ['fiddle', 'wrap', 'data'])
+    calls = []
+    self.assertResponse(app.get('/data'), 200, "{'q': None}")
+    self.assertResponse(app.head('/data'), 200)
+    self.assertEqual(calls, ['fiddle', 'wrap', 'fiddle', 'wrap'])
+    calls = []
+    self.assertResponse(app.get('/data?q=1'), 200, "{'q': u'1'}")
+    self.assertResponse(app.get('/data', headers={'Accept': 'text/plain'}), 200)
+    self.assertResponse(app.post('/data'), 200, "{'q': None}")
+    self.assertEqual(calls.count('data'), 3)
+    calls = []
+    for count in range(2):
+      self.assertResponse(app.get('/live'), 200, 'live')
+      self.assertResponse(app.get('/error', status='*'), 404)
+    self.assertEqual(calls.count('live') + calls.count('error'), 4)
+    self.assertEqual(dispatcher.responseCache.stats().hits, 2)
+
+  #----------------------------------------------------------------------------
+  def test_response_cache_behind_wrappers(self):
+    # 'Cached responses are only served after all wrappers have run'
+    from pyramid.httpexceptions import HTTPForbidden
+    class Root(Controller):
+      @wrap
+      def _auth(self, request, handler):
+        if request.headers.get('X-User') != 'admin':
+          raise HTTPForbidden()
+        response = handler(request)
+        response.headers['X-Wrapped'] = 'yes'
+        return response
+      @expose(cache=True)
+      def secret(self, request):
+        calls.append('secret')
+        return 'secret'
+      @expose(cache=True)
+      def private(self, request):
+        calls.append('private')
+        request.response.cache_control.private = True
+        return 'private'
+      @expose(cache=True)
+      def nostore(self, request):
+        calls.append('nostore')
+        request.response.cache_control.no_store = True
+        return 'nostore'
+    calls = []
+    admin = {'X-User': 'admin'}
+    app = TestApp(self.makeApp(Root()))
+    self.assertResponse(app.get('/secret', status='*'), 403)
+    res = self.assertResponse(app.get('/secret', headers=admin), 200, 'secret')
+    self.assertEqual(res.headers['X-Wrapped'], 'yes')
+    self.assertResponse(app.get('/secret', status='*'), 403)
+    res = self.assertResponse(app.get('/secret', headers=admin), 200, 'secret')
+    self.assertEqual(res.headers['X-Wrapped'], 'yes')
+    self.assertEqual(calls, ['secret'])
+    calls = []
+    for count in range(2):
+      self.assertResponse(app.get('/private', headers=admin), 200, 'private')
+      self.assertResponse(app.get('/nostore', headers=admin), 200, 'nostore')
+    self.assertEqual(calls, ['private', 'nostore', 'private', 'nostore'])
+
+  #----------------------------------------------------------------------------
+  def test_conditional_request(self):
+    # 'Handlers can declare validators that short-circuit to a 304'
+    class Root(Controller):
+      version = 'v1'
+      def _etag(self, request):
+        calls.append('etag')
+        return self.version
+      @wrap
+      def _wrap(self, request, handler):
+        calls.append('wrap')
+        return handler(request)
+      @index(etag='_etag', forceSlash=False)
+      def index(self, request):
+        calls.append('index')
+        return 'index'
+      @expose(lastModified=lambda request: 1500000000, cache=True)
+      def data(self, request):
+        calls.append('data')
+        return 'data'
+    calls = []
+    root = Root()
+    app  = TestApp(self.makeApp(root))
+    res  = self.assertResponse(app.get('/'), 200, 'index')
+    self.assertEqual(res.headers['ETag'], '"v1"')
+    self.assertEqual(calls, ['wrap', 'etag', 'index'])
+    calls = []
+    self.assertResponse(app.get('/', headers={'If-None-Match': '"v1"'}), 304)
+    self.assertResponse(app.head('/', headers={'If-None-Match': '"v0", "v1"'}), 304)
+    self.assertResponse(app.post('/', headers={'If-None-Match': '"v1"'}), 200, 'index')
+    self.assertEqual(calls, ['wrap', 'etag', 'wrap', 'etag', 'wrap', 'index'])
+    calls = []
+    root.version = 'v2'
+    res = self.assertResponse(app.get('/', headers={'If-None-Match': '"v1"'}), 200, 'index')
+    self.assertEqual(res.headers['ETag'], '"v2"')
+    self.assertEqual(calls, ['wrap', 'etag', 'index'])
+    calls = []
+    res = self.assertResponse(app.get('/data'), 200, 'data')
+    self.assertEqual(res.headers['Last-Modified'], 'Fri, 14 Jul 2017 02:40:00 GMT')
+    self.assertResponse(
+      app.get('/data', headers={'If-Modified-Since': 'Fri, 14 Jul 2017 02:40:00 GMT'}), 304)
+    self.assertResponse(
+      app.get('/data', headers={'If-Modified-Since': 'Fri, 14 Jul 2017 02:39:59 GMT'}), 200, 'data')
+    self.assertEqual(calls, ['wrap', 'data', 'wrap', 'wrap'])
+
+  #----------------------------------------------------------------------------
+  def test_response_cache_expiry(self):
+    from pyramid_controllers.cache import MemoryResponseCache
+    cache = MemoryResponseCache(size=2)
+    cache.put('a', 'A', ttl=-1)
+    cache.put('b', 'B', ttl=60)
+    cache.put('c', 'C')
+    self.assertEqual([cache.get(key) for key in 'abc'], [None, 'B', 'C'])
+    self.assertEqual(
+      cache.stats(),
+      dict(size=2, maxsize=2, hits=2, misses=1, evictions=1, expirations=0))
+    cache.put('d', 'D', ttl=-1)
+    self.assertIsNone(cache.get('d'))
+    self.assertEqual(cache.stats().expirations, 1)
+
+  #----------------------------------------------------------------------------
+  # TEST INSTRUMENTATION
+  #----------------------------------------------------------------------------
+
+  def test_instrument(self):
+    # 'An instrument receives per-phase timing events tagged with the route'
+    from pyramid_controllers.instrument import Instrument, PhaseTimer
+    class Collector(Instrument):
+      def __init__(self):
+        self.events = []
+      def record(self, request, phase, elapsed, controller, route, target):
+        self.assertTrue(elapsed >= 0)
+        self.events.append((phase, controller.__name__, route,
+                            getattr(target, '__name__', None)))
+    Collector.assertTrue = self.assertTrue
+    class Item(Controller):
+      @fiddle
+      def _fiddle(self, request): pass
+      @wrap
+      def _wrap(self, request, handler): return handler(request)
+      @expose(renderer='repr')
+      def data(self, request): return dict(ok=True)
+    class Items(Controller):
+      @lookup
+      def _lookup(self, request, key, *rem):
+        return (Item(), rem)
+    class Root(Controller):
+      items = Items()
+    collector = Collector()
+    dispatcher = Dispatcher(instrument=collector)
+    self.assertResponse(self.send(Root(), '/items/42/data', dispatcher=dispatcher),
+                        200, "{'ok': True}")
+    route = '/items/{...}/data'
+    self.assertEqual(collector.events, [
+      ('path',    'Root',  route, None),
+      ('lookup',  'Items', route, '_lookup'),
+      ('fiddle',  'Item',  route, '_fiddle'),
+      ('handler', 'Item',  route, 'data'),
+      ('wrap',    'Item',  route, None),
+      ('render',  'Item',  route, 'data'),
+    ])
+    timer = PhaseTimer()
+    dispatcher = Dispatcher(instrument=timer, planCacheSize=10)
+    item = Item()
+    for count in range(3):
+      self.assertResponse(self.send(Root(), '/items/', dispatcher=dispatcher), 404)
+      self.assertResponse(self.send(item, '/data', dispatcher=dispatcher), 200)
+    stats = dict(((stat.phase, stat.route), stat.count) for stat in timer.stats())
+    self.assertEqual(stats, {
+      ('path', '/items'): 3, ('path', '/data'): 1, ('fiddle', '/data'): 3,
+      ('handler', '/data'): 3, ('wrap', '/data'): 3, ('render', '/data'): 3})
+
+  def test_trace(self):
+    # 'Sampled requests record a trace of the walk decisions'
+    from pyramid_controllers.dispatcher import getDispatchContext
+    traces = []
+    class Item(Controller):
+      @expose(method='POST')
+      def data(self, request): return 'post'
+      @default
+      def _default(self, request, *rem):
+        traces.append(getDispatchContext(request).trace)
+        return 'default:' + '/'.join(rem)
+    class Root(Controller):
+      @lookup
+      def _lookup(self, request, key, *rem):
+        return (Item(), rem)
+    self.assertResponse(
+      self.send(Root(), '/42/data', dispatcher=Dispatcher(traceRate=1)),
+      200, 'default:data')
+    self.assertEqual(
+      [(e.event, e.controller, e.segment, e.target, e.accepted, e.reason) for e in traces[0]], [
+        ('walk',      'Root', None,   None,       None,  None),
+        ('candidate', 'Root', '42',   None,       False, 'no such handler or controller'),
+        ('lookup',    'Root', '42',   '_lookup',  True,  None),
+        ('walk',      'Item', None,   None,       None,  None),
+        ('candidate', 'Item', 'data', 'data',     False, 'method GET not in POST'),
+        ('default',   'Item', 'data', '_default', True,  None),
+      ])
+    self.assertEqual(traces[0][0].remainder, ['42', 'data'])
+    self.assertResponse(
+      self.send(Root(), '/42/data', dispatcher=Dispatcher()),
+      200, 'default:data')
+    self.assertIsNone(traces[1])
+
+  def test_trace_descriptor(self):
+    # 'Tracing supports descriptor-based sub-controllers'
+    from pyramid_controllers.dispatcher import getDispatchContext
+    traces = []
+    class Item(Controller):
+      @expose
+      def data(self, request):
+        traces.append(getDispatchContext(request).trace)
+        return 'data'
+    class Root(Controller):
+      @property
+      def item(self):
+        return Item()
+    self.assertResponse(
+      self.send(Root(), '/item/data', dispatcher=Dispatcher(traceRate=1)), 200, 'data')
+    self.assertEqual(
+      [(e.event, e.controller, e.segment, e.target, e.accepted) for e in traces[0]], [
+        ('walk',      'Root', None,   None,   None),
+        ('candidate', 'Root', 'item', 'item', True),
+        ('walk',      'Item', None,   None,   None),
+        ('candidate', 'Item', 'data', 'data', True),
+      ])
+
+  #----------------------------------------------------------------------------
+  # TEST DISPATCH CONTEXT
+  #----------------------------------------------------------------------------
+
+  def test_dispatch_context(self):
+    # 'The dispatcher attaches its context to the request being dispatched'
+    from pyramid_controllers.dispatcher import getDispatcher, getDispatchContext
+    dispatcher = Dispatcher()
+    class Sub(Controller):
+      @expose
+      def ctxt(self, request):
+        ctxt = getDispatchContext(request)
+        return 'ok:%r,%r,%r,%r' % (
+          getDispatcher(request) is dispatcher,
+          ctxt.root is root, ctxt.controller is self, list(ctxt.remainder))
+    class Root(Controller):
+      sub = Sub()
+    root = Root()
+    self.assertResponse(
+      self.send(root, '/sub/ctxt', dispatcher=dispatcher),
+      200, "ok:True,True,True,[u'ctxt']")
+    self.assertIsNone(getDispatcher(Request.blank('/')))
 
   #----------------------------------------------------------------------------
   # TEST CUSTOM DISPATCHER
@@ -777,33 +1804,36 @@ class TestDispatcher(TestHelper):
     self.assertResponse(self.send(Root(), "/srep"), 200, "{'m': 'srep'}")
     self.assertResponse(self.send(Root(), "/sraw"), 200, "RAW:{'m': 'sraw'}")
 
-  # def test_expose_defaults_does_not_pollute(self):
-  #   class Base(Controller):
-  #     def __init__(self):
-  #       super(Base,self).__init__()
-  #       self.count = 0
-  #     @expose
-  #     def m(self, request):
-  #       self.count += 1
-  #       return dict(c=self.count)
-  #   @expose_defaults(renderer='raw')
-  #   class Raw(Base):
-  #     pass
-  #   @expose_defaults(renderer='repr')
-  #   class Rep(Base):
-  #     pass
-  #   class Root(Controller):
-  #     raw = Raw()
-  #     rep = Rep()
-  #   def raw(info):
-  #     def _render(value, system):
-  #       return 'RAW:' + repr(value)
-  #     return _render
-  #   self.renderers['raw'] = raw
-  #   root = Root()
-  #   self.assertResponse(self.send(root, '/raw/m'), 200, "RAW:{'c': 1}")
-  #   self.assertResponse(self.send(root, '/rep/m'), 200, "{'c': 2}")
-  #   self.assertResponse(self.send(root, '/raw/m'), 200, "RAW:{'c': 3}")
+  def test_expose_defaults_does_not_pollute(self):
+    # 'Controller expose defaults do not alter base classes or decorations'
+    class Base(Controller):
+      def __init__(self):
+        super(Base,self).__init__()
+        self.count = 0
+      @expose
+      def m(self, request):
+        self.count += 1
+        return dict(c=self.count)
+    @expose_defaults(renderer='raw')
+    class Raw(Base):
+      pass
+    @expose_defaults(renderer='repr')
+    class Rep(Base):
+      pass
+    class Root(Controller):
+      raw = Raw()
+      rep = Rep()
+    def raw(info):
+      def _render(value, system):
+        return 'RAW:' + repr(value)
+      return _render
+    self.renderers['raw'] = raw
+    root = Root()
+    self.assertResponse(self.send(root, '/raw/m'), 200, "RAW:{'c': 1}")
+    self.assertResponse(self.send(root, '/rep/m'), 200, "{'c': 1}")
+    self.assertResponse(self.send(root, '/raw/m'), 200, "RAW:{'c': 2}")
+    self.assertEqual(getattr(Base.m, PCATTR).expose, [{}])
+    self.assertNotIn(PCCTRLATTR, vars(Base))
 
   def test_expose_defaults_ext(self):
     # 'Controllers can specify default extensions for member @expose calls'
@@ -901,8 +1931,7 @@ class TestDispatcher(TestHelper):
     # note: this is violating the abstraction barrier... oh well. testing
     #       the i-rep!... :)
     self.assertEqual(
-      #sorted(getattr(Root().foo, PCATTR).expose[0]['name']),
-      sorted(Dispatcher().makeMeta(Root().foo).expose.keys()),
+      sorted(Dispatcher().makeMeta(Root).expose.keys()),
       sorted(['blue.json', 'blue.yaml', 'moon.json', 'moon.yaml']))
     self.assertResponse(self.send(Root(), '/blue.html'), 404)
     self.assertResponse(self.send(Root(), '/blue'),      404)
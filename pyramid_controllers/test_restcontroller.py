@@ -48,7 +48,8 @@ class TestRestController(TestHelper):
       def put(self, request): return 'ok.put'
     self.assertResponse(self.send(RestRoot(), '/', method='GET'),    200, 'ok.get')
     self.assertResponse(self.send(RestRoot(), '/', method='PUT'),    405)
-    self.assertResponse(self.send(RestRoot(), '/', method='DELETE'), 405)
+    res = self.assertResponse(self.send(RestRoot(), '/', method='DELETE'), 405)
+    self.assertEqual(res.headers['Allow'], 'GET')
 
   #----------------------------------------------------------------------------
   def test_sub_controller(self):
@@ -90,6 +91,47 @@ class TestRestController(TestHelper):
     self.assertResponse(
       self.send(Root(), '/rest', method='GET'), 200, "{'foo': 'zig'}")
 
+  #----------------------------------------------------------------------------
+  def test_native_verb_dispatch(self):
+    # 'RestController verbs are resolved by the dispatcher, not by @index'
+    class Rest(RestController):
+      @expose(renderer='repr')
+      def get(self, request):
+        return dict(snag=hasattr(request, '_restcontroller_snaghack'))
+    self.assertResponse(
+      self.send(Rest(), '/', method='GET'), 200, "{'snag': False}")
+
+  #----------------------------------------------------------------------------
+  def test_plan_cache_method_override(self):
+    # 'cached RestController plans honor the "_method" override'
+    class Rest(RestController):
+      @expose
+      def post(self, request): return 'ok.post'
+      @expose
+      def delete(self, request): return 'ok.delete'
+    root = Rest()
+    dispatcher = Dispatcher(planCacheSize=10)
+    self.assertResponse(self.send(root, '/', method='POST', dispatcher=dispatcher), 200, 'ok.post')
+    self.assertResponse(self.send(root, '/', method='POST', dispatcher=dispatcher), 200, 'ok.post')
+    self.assertResponse(self.send(root, '/?_method=DELETE', method='POST', dispatcher=dispatcher), 200, 'ok.delete')
+    self.assertEqual(len(dispatcher.plans), 1)
+
+  #----------------------------------------------------------------------------
+  def test_overridden_index(self):
+    # 'RestController subclasses can override and extend @index'
+    class Rest(RestController):
+      @index(forceSlash=False)
+      def index(self, request):
+        ret = super(Rest, self).index(request)
+        if isinstance(ret, dict):
+          ret['foo'] += '.index'
+        return ret
+      @expose(renderer='repr')
+      def get(self, request): return dict(foo='bar')
+    self.assertResponse(
+      self.send(Rest(), '/', method='GET'), 200, "{'foo': 'bar.index'}")
+    self.assertResponse(self.send(Rest(), '/', method='PUT'), 405)
+
 #------------------------------------------------------------------------------
 # end of $Id$
 #------------------------------------------------------------------------------
@@ -7,11 +7,71 @@
 # copy: (C) Copyright 2013 Cadit Inc., see LICENSE.txt
 #------------------------------------------------------------------------------
 
-import sys, pkg_resources
+import sys, re, pkg_resources
+from six.moves.urllib.parse import unquote
 from .adict import adict, pick
 
 PY3 = sys.version_info[0] == 3
 
+HTTP_METHODS = (
+
+  # shamelessly scrubbed from:
+  #   http://annevankesteren.nl/2007/10/http-methods
+  # todo: need to do some real research and bump this.
+
+  # RFC 2616 (HTTP 1.1):
+  'OPTIONS',
+  'GET',
+  'HEAD',
+  'POST',
+  'PUT',
+  'DELETE',
+  'TRACE',
+  'CONNECT',
+
+  # RFC 2518 (WebDAV):
+  'PROPFIND',
+  'PROPPATCH',
+  'MKCOL',
+  'COPY',
+  'MOVE',
+  'LOCK',
+  'UNLOCK',
+
+  # RFC 3253 (WebDAV versioning):
+  'VERSION-CONTROL',
+  'REPORT',
+  'CHECKOUT',
+  'CHECKIN',
+  'UNCHECKOUT',
+  'MKWORKSPACE',
+  'UPDATE',
+  'LABEL',
+  'MERGE',
+  'BASELINE-CONTROL',
+  'MKACTIVITY',
+
+  # RFC 3648 (WebDAV collections):
+  'ORDERPATCH',
+
+  # RFC 3744 (WebDAV access control):
+  'ACL',
+
+  # draft-dusseault-http-patch:
+  'PATCH',
+
+  # draft-reschke-webdav-search:
+  'SEARCH',
+
+)
+
+#------------------------------------------------------------------------------
+def meth2action(meth):
+  return re.sub('[^a-z]+', '_', meth.lower())
+
+def action2meth(action):
+  return re.sub('[^A-Z]+', '-', action.upper())
+
 #------------------------------------------------------------------------------
 def getMethod(request):
   name = request.params.get('_method', '').strip()
@@ -19,6 +79,33 @@ def getMethod(request):
     return name.upper()
   return request.method
 
+#------------------------------------------------------------------------------
+def splitPath(path):
+  '''
+  Normalizes the URL-encoded `path`, splits it at slashes ('/') and
+  returns a tuple of the URL-decoded components. The normalization
+  is done on the encoded path: empty and "." components are dropped,
+  ".." removes the preceding component (leading ".." are dropped),
+  and a trailing slash results in a trailing empty component. Thus
+  an encoded slash ("%2F") is never treated as a separator. For
+  example, ``/a//./b/../c/`` becomes ``('a', 'c', '')`` and ``/``
+  (or an empty path) becomes ``('',)``.
+  '''
+  parts = []
+  for part in path.split('/'):
+    if not part or part == '.':
+      continue
+    if part == '..':
+      if parts:
+        parts.pop()
+      continue
+    parts.append(part)
+  if not parts:
+    return ('',)
+  if path.endswith('/'):
+    parts.append('')
+  return tuple([unquote(part) for part in parts])
+
 #------------------------------------------------------------------------------
 def getVersion(package='pyramid_controllers', default='unknown'):
   try: